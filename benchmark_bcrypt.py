@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+SmartHealth - Benchmark de bcrypt
+=================================
+Ejecutar: python benchmark_bcrypt.py
+          python benchmark_bcrypt.py --budget-ms 100
+
+Mide cuánto tarda un hash con cada costo y sugiere el mayor que queda
+dentro del presupuesto. El resultado va en BCRYPT_ROUNDS del .env.
+No forma parte de ninguna suite: los tiempos dependen de la máquina.
+"""
+
+import argparse
+import timeit
+
+from passlib.context import CryptContext
+
+MIN_ROUNDS = 10
+MAX_ROUNDS = 14
+
+
+def measure(rounds: int, repeat: int = 3) -> float:
+    """Milisegundos por hash (mejor de `repeat`) con el costo indicado"""
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    timer = timeit.Timer(lambda: context.hash("x" * 16))
+    return min(timer.repeat(repeat=repeat, number=1)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de bcrypt")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=100,
+        help="Tiempo máximo aceptable por hash (default: 100 ms)"
+    )
+    args = parser.parse_args()
+    
+    best = None
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        ms = measure(rounds)
+        print(f"  rounds={rounds:2d}: {ms:8.1f} ms/hash")
+        if ms <= args.budget_ms:
+            best = rounds
+        else:
+            # Cada punto de costo duplica el tiempo: no vale la pena seguir
+            break
+    
+    print()
+    if best is None:
+        print(f"Ningún costo >= {MIN_ROUNDS} cabe en {args.budget_ms:.0f} ms; usar BCRYPT_ROUNDS={MIN_ROUNDS}")
+    else:
+        print(f"Sugerido: BCRYPT_ROUNDS={best}")
+
+
+if __name__ == "__main__":
+    main()
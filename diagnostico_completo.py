@@ -2,6 +2,9 @@
 SmartHealth - Diagnóstico Completo del Sistema
 ===============================================
 Ejecutar: python diagnostico_completo.py
+          python diagnostico_completo.py --only env   (un solo chequeo)
+          python diagnostico_completo.py --watch 30   (repetir cada 30s)
+          python diagnostico_completo.py --json       (salida para CI)
 
 Verifica:
 1. Base de datos PostgreSQL
@@ -11,13 +14,20 @@ Verifica:
 5. Conexión OpenAI
 """
 
+import argparse
+import importlib
+import json
 import os
+import socket
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 
-# Agregar el directorio src al path
 root_dir = Path(__file__).parent
-sys.path.insert(0, str(root_dir / "src"))
 
 # Colores
 class Colors:
@@ -29,62 +39,152 @@ class Colors:
     RESET = '\033[0m'
     BOLD = '\033[1m'
 
+# Sin TTY (CI, redirección a archivo) o con NO_COLOR: nada de escapes ANSI
+_USE_COLOR = sys.stdout.isatty() and os.environ.get("NO_COLOR") is None
+if not _USE_COLOR:
+    for _name in ("GREEN", "RED", "YELLOW", "BLUE", "CYAN", "RESET", "BOLD"):
+        setattr(Colors, _name, "")
+
+# Prefijos ya compuestos: cada print_* hace una sola concatenación
+_OK = f"{Colors.GREEN}✅ "
+_ERR = f"{Colors.RED}❌ "
+_WARN = f"{Colors.YELLOW}⚠️  "
+_INFO = f"{Colors.CYAN}ℹ️  "
+_RESET = Colors.RESET
+
+# Salida acumulada en memoria: se escribe de una vez por sección.
+# Un buffer por hilo, para que los chequeos en paralelo no se mezclen
+_local = threading.local()
+
+# Con --json no se genera salida de texto (solo el JSON final)
+_quiet = False
+
+def _current_buffer():
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = []
+    return buffer
+
+def _emit(text=""):
+    if not _quiet:
+        _current_buffer().append(text)
+
+def _write_lines(lines):
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def _flush_output():
+    """Vuelca la sección actual con un solo write"""
+    buffer = _current_buffer()
+    _write_lines(buffer)
+    buffer.clear()
+
 def print_header(text):
-    print(f"\n{Colors.BLUE}{Colors.BOLD}{'='*70}")
-    print(f"  {text}")
-    print(f"{'='*70}{Colors.RESET}\n")
+    _emit(f"\n{Colors.BLUE}{Colors.BOLD}{'='*70}")
+    _emit(f"  {text}")
+    _emit(f"{'='*70}{Colors.RESET}\n")
 
 def print_success(text):
-    print(f"{Colors.GREEN}✅ {text}{Colors.RESET}")
+    _emit(_OK + text + _RESET)
 
 def print_error(text):
-    print(f"{Colors.RED}❌ {text}{Colors.RESET}")
+    _emit(_ERR + text + _RESET)
 
 def print_warning(text):
-    print(f"{Colors.YELLOW}⚠️  {text}{Colors.RESET}")
+    _emit(_WARN + text + _RESET)
 
 def print_info(text):
-    print(f"{Colors.CYAN}ℹ️  {text}{Colors.RESET}")
+    _emit(_INFO + text + _RESET)
 
 # =============================================================================
 # 1. VERIFICAR VARIABLES DE ENTORNO
 # =============================================================================
 
+# Variables requeridas
+REQUIRED_VARS = {
+    "DB_HOST": "Host de PostgreSQL",
+    "DB_PORT": "Puerto de PostgreSQL",
+    "DB_NAME": "Nombre de la base de datos",
+    "DB_USER": "Usuario de PostgreSQL",
+    "DB_PASSWORD": "Contraseña de PostgreSQL",
+    "SECRET_KEY": "Clave secreta para JWT",
+    "OPENAI_API_KEY": "API Key de OpenAI"
+}
+
+def _env_already_set():
+    """
+    True si el entorno ya trae todas las variables (p. ej. Docker). Las que
+    se cargaron del .env no cuentan: en --watch el .env se sigue vigilando
+    """
+    return all(
+        os.environ.get(var) and var not in _ENV_CACHED_DICT
+        for var in REQUIRED_VARS
+    )
+
+# Último .env leído: solo se vuelve a parsear si cambia su mtime.
+# _ENV_CACHED_DICT guarda solo las variables que se tomaron del .env
+_ENV_MTIME = None
+_ENV_CACHED_DICT = {}
+
+def _load_env():
+    """
+    Vuelca el .env en os.environ sin sobrescribir variables definidas fuera
+    de él (igual que load_dotenv). Si el archivo no cambió, basta un stat()
+    """
+    global _ENV_MTIME, _ENV_CACHED_DICT
+    env_path = root_dir / ".env"
+    mtime = env_path.stat().st_mtime_ns
+    if mtime == _ENV_MTIME:
+        return _ENV_CACHED_DICT
+    
+    from dotenv import dotenv_values
+    
+    values = {}
+    for key, value in dotenv_values(env_path).items():
+        if value is None:
+            continue
+        # Las que vinieron del .env anterior sí se actualizan (--watch)
+        if key not in os.environ or key in _ENV_CACHED_DICT:
+            os.environ[key] = value
+            values[key] = value
+    
+    if _ENV_MTIME is not None:
+        # Credenciales nuevas: la conexión compartida y los OK en caché
+        # corresponden a las anteriores
+        _build_db_config.cache_clear()
+        _close_shared_conn()
+        _ok_cache.clear()
+    _ENV_MTIME, _ENV_CACHED_DICT = mtime, values
+    return values
+
 def test_environment_variables():
     print_header("1. VARIABLES DE ENTORNO")
     
-    # Cargar .env
-    try:
-        from dotenv import load_dotenv
-        env_path = root_dir / ".env"
-        
-        if not env_path.exists():
-            print_error(f"Archivo .env no encontrado en: {env_path}")
-            print_info("Crea el archivo .env en la raíz del proyecto")
+    # Cargar .env (solo si el entorno no trae ya las variables)
+    if _env_already_set():
+        print_success("Variables ya definidas en el entorno (se omite .env)")
+    else:
+        try:
+            env_path = root_dir / ".env"
+            
+            if not env_path.exists():
+                print_error(f"Archivo .env no encontrado en: {env_path}")
+                print_info("Crea el archivo .env en la raíz del proyecto")
+                return False
+            
+            _load_env()
+            print_success(f"Archivo .env encontrado: {env_path}")
+            
+        except ImportError:
+            print_error("python-dotenv no está instalado")
+            print_info("Instalar con: pip install python-dotenv")
             return False
-        
-        load_dotenv(env_path)
-        print_success(f"Archivo .env encontrado: {env_path}")
-        
-    except ImportError:
-        print_error("python-dotenv no está instalado")
-        print_info("Instalar con: pip install python-dotenv")
-        return False
-    
-    # Variables requeridas
-    required_vars = {
-        "DB_HOST": "Host de PostgreSQL",
-        "DB_PORT": "Puerto de PostgreSQL",
-        "DB_NAME": "Nombre de la base de datos",
-        "DB_USER": "Usuario de PostgreSQL",
-        "DB_PASSWORD": "Contraseña de PostgreSQL",
-        "SECRET_KEY": "Clave secreta para JWT",
-        "OPENAI_API_KEY": "API Key de OpenAI"
-    }
     
+    env = os.environ
     all_present = True
-    for var, description in required_vars.items():
-        value = os.getenv(var)
+    for var, description in REQUIRED_VARS.items():
+        value = env.get(var)
         if value:
             if var in ["DB_PASSWORD", "SECRET_KEY", "OPENAI_API_KEY"]:
                 masked = value[:10] + "..." if len(value) > 10 else "***"
@@ -101,53 +201,124 @@ def test_environment_variables():
     
     return True
 
+# =============================================================================
+# CONEXIÓN COMPARTIDA A POSTGRESQL
+# =============================================================================
+
+# Una sola conexión psycopg2 para los chequeos 2, 3 y 4
+_shared_conn = None
+
+# En modo --watch las consultas del esquema se preparan en el servidor
+# (PREPARE) y cada iteración solo las ejecuta (EXECUTE)
+_use_prepared = False
+_prepared = set()
+
+@lru_cache(maxsize=1)
+def _build_db_config():
+    """Credenciales de la base de datos (se leen una vez, tras cargar el .env)"""
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "database": os.getenv("DB_NAME", "smarthdb"),
+        "user": os.getenv("DB_USER", "sm_admin"),
+        "password": os.getenv("DB_PASSWORD", "sm2025")
+    }
+
+def _get_shared_conn():
+    """Abre la conexión la primera vez y la reutiliza en los demás chequeos"""
+    global _shared_conn
+    if _shared_conn is None or _shared_conn.closed:
+        psycopg2 = importlib.import_module("psycopg2")
+        # Las sentencias preparadas viven en la conexión anterior
+        _prepared.clear()
+        _shared_conn = psycopg2.connect(**_build_db_config())
+        # Solo lecturas: un error en un chequeo no debe abortar los siguientes
+        _shared_conn.autocommit = True
+    return _shared_conn
+
+@contextmanager
+def db_cursor(conn=None):
+    """
+    Cursor sobre la conexión compartida: siempre se cierra y,
+    si el chequeo falla, se deshace cualquier transacción abierta
+    """
+    if conn is None:
+        conn = _get_shared_conn()
+    cursor = conn.cursor()
+    try:
+        yield cursor
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# Chequeos exitosos recientes (para --watch): nombre -> time.monotonic()
+# Solo se cachea el éxito, para detectar enseguida cuando algo se recupera
+_ok_cache = {}
+
+PGVECTOR_TTL = 300   # la extensión prácticamente no cambia
+SCHEMA_TTL = 30      # los conteos de registros sí
+
+def _recently_ok(name, ttl):
+    """True si el chequeo pasó hace menos de ttl segundos"""
+    ts = _ok_cache.get(name)
+    if ts is not None and time.monotonic() - ts < ttl:
+        print_success(f"OK (resultado en caché, hace {time.monotonic() - ts:.0f}s)")
+        return True
+    return False
+
+def _mark_ok(name):
+    _ok_cache[name] = time.monotonic()
+    return True
+
+def _close_shared_conn():
+    """Cierra la conexión compartida si fue abierta"""
+    global _shared_conn
+    if _shared_conn is not None:
+        _shared_conn.close()
+        _shared_conn = None
+    _prepared.clear()
+
 # =============================================================================
 # 2. VERIFICAR CONEXIÓN A POSTGRESQL
 # =============================================================================
 
-def test_postgresql_connection():
+def test_postgresql_connection(conn=None):
     print_header("2. CONEXIÓN A POSTGRESQL")
     
     try:
-        import psycopg2
+        psycopg2 = importlib.import_module("psycopg2")
     except ImportError:
         print_error("psycopg2 no está instalado")
         print_info("Instalar con: pip install psycopg2-binary")
         return False
     
     # Obtener credenciales
-    db_config = {
-        "host": os.getenv("DB_HOST", "localhost"),
-        "port": os.getenv("DB_PORT", "5432"),
-        "database": os.getenv("DB_NAME", "smarthdb"),
-        "user": os.getenv("DB_USER", "sm_admin"),
-        "password": os.getenv("DB_PASSWORD", "sm2025")
-    }
+    db_config = _build_db_config()
     
     print_info(f"Intentando conectar a: {db_config['user']}@{db_config['host']}:{db_config['port']}/{db_config['database']}")
     
     try:
-        conn = psycopg2.connect(**db_config)
-        print_success("Conexión exitosa a PostgreSQL")
-        
-        # Verificar versión
-        cursor = conn.cursor()
-        cursor.execute("SELECT version();")
-        version = cursor.fetchone()[0]
-        print_info(f"Versión: {version.split(',')[0]}")
-        
-        cursor.close()
-        conn.close()
-        return True
+        with db_cursor(conn) as cursor:
+            print_success("Conexión exitosa a PostgreSQL")
+            
+            # Verificar versión
+            cursor.execute("SELECT version();")
+            version = cursor.fetchone()[0]
+            print_info(f"Versión: {version.split(',')[0]}")
+            
+            return True
         
     except psycopg2.OperationalError as e:
         print_error(f"Error de conexión: {e}")
         print_warning("\nPosibles soluciones:")
-        print("   1. Verifica que PostgreSQL esté corriendo:")
-        print("      - Windows: net start postgresql-x64-16")
-        print("      - Linux: sudo systemctl start postgresql")
-        print("   2. Verifica las credenciales en .env")
-        print("   3. Verifica el puerto (default: 5432)")
+        _emit("   1. Verifica que PostgreSQL esté corriendo:")
+        _emit("      - Windows: net start postgresql-x64-16")
+        _emit("      - Linux: sudo systemctl start postgresql")
+        _emit("   2. Verifica las credenciales en .env")
+        _emit("   3. Verifica el puerto (default: 5432)")
         return False
     except Exception as e:
         print_error(f"Error inesperado: {type(e).__name__}: {e}")
@@ -157,49 +328,36 @@ def test_postgresql_connection():
 # 3. VERIFICAR EXTENSIÓN PGVECTOR
 # =============================================================================
 
-def test_pgvector_extension():
+def test_pgvector_extension(conn=None):
     print_header("3. EXTENSIÓN PGVECTOR")
     
+    if _recently_ok("pgvector", PGVECTOR_TTL):
+        return True
+    
     try:
-        import psycopg2
-        
-        db_config = {
-            "host": os.getenv("DB_HOST", "localhost"),
-            "port": os.getenv("DB_PORT", "5432"),
-            "database": os.getenv("DB_NAME", "smarthdb"),
-            "user": os.getenv("DB_USER", "sm_admin"),
-            "password": os.getenv("DB_PASSWORD", "sm2025")
-        }
-        
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        
-        # Verificar extensión
-        cursor.execute("""
-            SELECT extname, extversion 
-            FROM pg_extension 
-            WHERE extname = 'vector';
-        """)
-        
-        result = cursor.fetchone()
-        
-        if result:
-            print_success(f"pgvector instalado - Versión: {result[1]}")
-            cursor.close()
-            conn.close()
-            return True
-        else:
-            print_error("pgvector NO está instalado")
-            print_warning("\nInstalar pgvector:")
-            print("   1. Asegúrate de tener permisos de SUPERUSER:")
-            print("      psql -U postgres -d smarthdb")
-            print("      ALTER USER sm_admin WITH SUPERUSER;")
-            print("   2. Instala la extensión:")
-            print("      CREATE EXTENSION vector;")
-            cursor.close()
-            conn.close()
-            return False
+        with db_cursor(conn) as cursor:
+            # Verificar extensión
+            cursor.execute("""
+                SELECT extname, extversion 
+                FROM pg_extension 
+                WHERE extname = 'vector';
+            """)
+            
+            result = cursor.fetchone()
             
+            if result:
+                print_success(f"pgvector instalado - Versión: {result[1]}")
+                return _mark_ok("pgvector")
+            else:
+                print_error("pgvector NO está instalado")
+                print_warning("\nInstalar pgvector:")
+                _emit("   1. Asegúrate de tener permisos de SUPERUSER:")
+                _emit("      psql -U postgres -d smarthdb")
+                _emit("      ALTER USER sm_admin WITH SUPERUSER;")
+                _emit("   2. Instala la extensión:")
+                _emit("      CREATE EXTENSION vector;")
+                return False
+        
     except Exception as e:
         print_error(f"Error verificando pgvector: {e}")
         return False
@@ -208,87 +366,84 @@ def test_pgvector_extension():
 # 4. VERIFICAR ESQUEMA Y TABLAS
 # =============================================================================
 
-def test_database_schema():
+SCHEMA_QUERIES = {
+    # Esquema + listado de tablas en un solo round-trip
+    "smart_health_tables": """
+        SELECT
+            EXISTS (
+                SELECT 1 FROM information_schema.schemata
+                WHERE schema_name = 'smart_health'
+            ),
+            COALESCE(
+                (SELECT array_agg(tablename::text ORDER BY tablename)
+                 FROM pg_tables
+                 WHERE schemaname = 'smart_health'),
+                ARRAY[]::text[]
+            )
+    """,
+    "smart_health_counts": """
+        SELECT
+            (SELECT COUNT(*) FROM smart_health.patients),
+            (SELECT COUNT(*) FROM smart_health.users)
+    """,
+}
+
+def _run_schema_query(cursor, name):
+    """Ejecuta una consulta del esquema (preparada una vez por conexión en --watch)"""
+    if not _use_prepared:
+        cursor.execute(SCHEMA_QUERIES[name])
+        return
+    
+    # Se prepara al primer uso: PREPARE falla si las tablas aún no existen
+    if name not in _prepared:
+        cursor.execute(f"PREPARE {name} AS {SCHEMA_QUERIES[name]}")
+        _prepared.add(name)
+    cursor.execute(f"EXECUTE {name}")
+
+def test_database_schema(conn=None):
     print_header("4. ESQUEMA Y TABLAS")
     
+    if _recently_ok("schema", SCHEMA_TTL):
+        return True
+    
     try:
-        import psycopg2
-        
-        db_config = {
-            "host": os.getenv("DB_HOST", "localhost"),
-            "port": os.getenv("DB_PORT", "5432"),
-            "database": os.getenv("DB_NAME", "smarthdb"),
-            "user": os.getenv("DB_USER", "sm_admin"),
-            "password": os.getenv("DB_PASSWORD", "sm2025")
-        }
-        
-        conn = psycopg2.connect(**db_config)
-        cursor = conn.cursor()
-        
-        # Verificar esquema smart_health
-        cursor.execute("""
-            SELECT schema_name 
-            FROM information_schema.schemata 
-            WHERE schema_name = 'smart_health';
-        """)
-        
-        if cursor.fetchone():
-            print_success("Esquema 'smart_health' existe")
-        else:
-            print_error("Esquema 'smart_health' NO existe")
-            print_info("Ejecuta los scripts de creación de base de datos")
-            cursor.close()
-            conn.close()
-            return False
-        
-        # Contar tablas
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = 'smart_health';
-        """)
-        
-        table_count = cursor.fetchone()[0]
-        
-        if table_count > 0:
-            print_success(f"Encontradas {table_count} tablas en smart_health")
+        with db_cursor(conn) as cursor:
+            _run_schema_query(cursor, "smart_health_tables")
+            schema_ok, tables = cursor.fetchone()
             
-            # Listar tablas
-            cursor.execute("""
-                SELECT tablename 
-                FROM pg_tables 
-                WHERE schemaname = 'smart_health'
-                ORDER BY tablename;
-            """)
+            if schema_ok:
+                print_success("Esquema 'smart_health' existe")
+            else:
+                print_error("Esquema 'smart_health' NO existe")
+                print_info("Ejecuta los scripts de creación de base de datos")
+                return False
             
-            tables = cursor.fetchall()
-            print_info("Tablas existentes:")
-            for table in tables:
-                print(f"   • {table[0]}")
+            if tables:
+                print_success(f"Encontradas {len(tables)} tablas en smart_health")
+                print_info("Tablas existentes:")
+                for table in tables:
+                    _emit(f"   • {table}")
+            else:
+                print_error("No hay tablas en el esquema smart_health")
+                print_info("Ejecuta: python pipelines/02-insert-data/create-tables.py")
+                return False
             
-        else:
-            print_error("No hay tablas en el esquema smart_health")
-            print_info("Ejecuta: python pipelines/02-insert-data/create-tables.py")
-            cursor.close()
-            conn.close()
-            return False
-        
-        # Verificar datos
-        cursor.execute("SELECT COUNT(*) FROM smart_health.patients;")
-        patient_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM smart_health.users;")
-        user_count = cursor.fetchone()[0]
-        
-        print_info(f"Registros: {patient_count} pacientes, {user_count} usuarios")
-        
-        if patient_count == 0:
-            print_warning("No hay pacientes en la base de datos")
-            print_info("Ejecuta: python pipelines/02-insert-data/script-02.py")
-        
-        cursor.close()
-        conn.close()
-        return True
+            # Verificar datos (solo si las tablas existen, si no la query falla)
+            missing = [t for t in ("patients", "users") if t not in tables]
+            if missing:
+                print_error(f"Faltan tablas requeridas: {', '.join(missing)}")
+                return False
+            
+            _run_schema_query(cursor, "smart_health_counts")
+            patient_count, user_count = cursor.fetchone()
+            
+            print_info(f"Registros: {patient_count} pacientes, {user_count} usuarios")
+            
+            if patient_count == 0:
+                print_warning("No hay pacientes en la base de datos")
+                print_info("Ejecuta: python pipelines/02-insert-data/script-02.py")
+            
+            return _mark_ok("schema")
         
     except Exception as e:
         print_error(f"Error verificando esquema: {e}")
@@ -301,9 +456,14 @@ def test_database_schema():
 def test_sqlalchemy_connection():
     print_header("5. CONEXIÓN SQLALCHEMY")
     
+    # Agregar el directorio src al path solo cuando se necesita la app
+    src_dir = str(root_dir / "src")
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    
     try:
-        from app.database.database import SessionLocal, engine
         from sqlalchemy import text
+        from app.database.database import SessionLocal
         
         print_info("Probando conexión con SQLAlchemy...")
         
@@ -335,55 +495,58 @@ def test_sqlalchemy_connection():
 def test_fastapi_server():
     print_header("6. SERVIDOR FASTAPI")
     
+    # http.client (stdlib) basta para un solo GET: evita cargar requests/urllib3
+    from http.client import HTTPConnection
+    
+    HOST = "localhost"
+    PORT = 8088
+    BASE_URL = f"http://{HOST}:{PORT}"
+    
+    print_info(f"Verificando servidor en {BASE_URL}...")
+    
     try:
-        import requests
-        
-        BASE_URL = "http://localhost:8088"
-        
-        print_info(f"Verificando servidor en {BASE_URL}...")
-        
         # Health check
+        conn = HTTPConnection(HOST, PORT, timeout=5)
         try:
-            response = requests.get(f"{BASE_URL}/health", timeout=5)
+            conn.request("GET", "/health")
+            response = conn.getresponse()
+            body = response.read()
+        finally:
+            conn.close()
+        
+        if response.status == 200:
+            print_success("Servidor FastAPI accesible")
             
-            if response.status_code == 200:
-                print_success("Servidor FastAPI accesible")
-                
-                data = response.json()
-                status = data.get('status')
-                
-                if status == 'healthy':
-                    print_success("Estado del servidor: HEALTHY")
-                else:
-                    print_warning(f"Estado del servidor: {status}")
-                
-                # Verificar servicios
-                services = data.get('services', {})
-                print_info("Estado de servicios:")
-                for service, state in services.items():
-                    if state in ['connected', 'ready', 'enabled']:
-                        print_success(f"  • {service}: {state}")
-                    else:
-                        print_error(f"  • {service}: {state}")
-                
-                return True
+            data = json.loads(body)
+            status = data.get('status')
+            
+            if status == 'healthy':
+                print_success("Estado del servidor: HEALTHY")
             else:
-                print_error(f"Servidor responde con código: {response.status_code}")
-                return False
-                
-        except requests.exceptions.ConnectionError:
-            print_error("No se puede conectar al servidor FastAPI")
-            print_warning("\nPara iniciar el servidor:")
-            print("   cd src")
-            print("   uvicorn app.main:app --reload --port 8088")
-            return False
-        except requests.exceptions.Timeout:
-            print_error("Timeout conectando al servidor (>5s)")
+                print_warning(f"Estado del servidor: {status}")
+            
+            # Verificar servicios
+            services = data.get('services', {})
+            print_info("Estado de servicios:")
+            for service, state in services.items():
+                if state in ['connected', 'ready', 'enabled']:
+                    print_success(f"  • {service}: {state}")
+                else:
+                    print_error(f"  • {service}: {state}")
+            
+            return True
+        else:
+            print_error(f"Servidor responde con código: {response.status}")
             return False
             
-    except ImportError:
-        print_error("requests no está instalado")
-        print_info("Instalar con: pip install requests")
+    except socket.timeout:
+        print_error("Timeout conectando al servidor (>5s)")
+        return False
+    except (ConnectionRefusedError, OSError):
+        print_error("No se puede conectar al servidor FastAPI")
+        print_warning("\nPara iniciar el servidor:")
+        _emit("   cd src")
+        _emit("   uvicorn app.main:app --reload --port 8088")
         return False
     except Exception as e:
         print_error(f"Error verificando FastAPI: {e}")
@@ -408,27 +571,19 @@ def test_openai_connection():
         print_warning("OPENAI_API_KEY tiene formato inusual")
     
     try:
-        from openai import OpenAI
+        OpenAI = importlib.import_module("openai").OpenAI
         
         client = OpenAI(api_key=api_key)
         
         print_info("Verificando conexión con OpenAI...")
         
-        # Test simple
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": "Say 'OK'"}],
-            max_tokens=5
-        )
+        # GET /v1/models/{modelo}: valida la API key sin generar (ni cobrar) tokens
+        model_name = os.getenv("LLM_MODEL", "gpt-4o-mini")
+        model = client.models.retrieve(model_name)
         
-        if response.choices[0].message.content:
-            print_success("Conexión OpenAI exitosa")
-            print_info(f"Modelo: {response.model}")
-            print_info(f"Tokens usados: {response.usage.total_tokens}")
-            return True
-        else:
-            print_error("Respuesta vacía de OpenAI")
-            return False
+        print_success("Conexión OpenAI exitosa")
+        print_info(f"Modelo disponible: {model.id}")
+        return True
             
     except ImportError:
         print_error("openai no está instalado")
@@ -437,61 +592,192 @@ def test_openai_connection():
     except Exception as e:
         print_error(f"Error conectando a OpenAI: {type(e).__name__}: {e}")
         print_warning("\nVerifica:")
-        print("   1. Tu API key es válida")
-        print("   2. Tienes créditos disponibles")
-        print("   3. Tu conexión a internet funciona")
+        _emit("   1. Tu API key es válida")
+        _emit("   2. Tienes créditos disponibles")
+        _emit("   3. Tu conexión a internet funciona")
         return False
 
 # =============================================================================
 # FUNCIÓN PRINCIPAL
 # =============================================================================
 
-def main():
-    print(f"{Colors.CYAN}{Colors.BOLD}")
-    print("╔" + "="*68 + "╗")
-    print("║" + " "*68 + "║")
-    print("║" + "  🏥 SMARTHEALTH - DIAGNÓSTICO COMPLETO DEL SISTEMA".center(68) + "║")
-    print("║" + " "*68 + "║")
-    print("╚" + "="*68 + "╝")
-    print(f"{Colors.RESET}\n")
-    
-    results = {
-        "Variables de Entorno": test_environment_variables(),
-        "Conexión PostgreSQL": test_postgresql_connection(),
-        "Extensión pgvector": test_pgvector_extension(),
-        "Esquema y Tablas": test_database_schema(),
-        "SQLAlchemy": test_sqlalchemy_connection(),
-        "Servidor FastAPI": test_fastapi_server(),
-        "OpenAI API": test_openai_connection()
-    }
+# Chequeos disponibles: clave CLI -> (etiqueta del resumen, nombre de la función)
+CHECKS = {
+    "env": ("Variables de Entorno", "test_environment_variables"),
+    "pg": ("Conexión PostgreSQL", "test_postgresql_connection"),
+    "pgvector": ("Extensión pgvector", "test_pgvector_extension"),
+    "schema": ("Esquema y Tablas", "test_database_schema"),
+    "sqlalchemy": ("SQLAlchemy", "test_sqlalchemy_connection"),
+    "fastapi": ("Servidor FastAPI", "test_fastapi_server"),
+    "openai": ("OpenAI API", "test_openai_connection"),
+}
+
+def load_env_file():
+    """Carga el .env en silencio (para chequeos individuales sin 'env')"""
+    if _env_already_set():
+        return
+    try:
+        _load_env()
+    except (ImportError, OSError):
+        return
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Diagnóstico completo del sistema SmartHealth"
+    )
+    parser.add_argument(
+        "--only",
+        choices=list(CHECKS),
+        help="Ejecutar solo el chequeo indicado"
+    )
+    parser.add_argument(
+        "--watch",
+        type=int,
+        metavar="SEGUNDOS",
+        help="Repetir el diagnóstico cada N segundos (Ctrl+C para salir)"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Imprimir solo un resumen JSON (con tiempos) y salir con 1 si algo falla"
+    )
+    return parser.parse_args(argv)
+
+# Los chequeos de PostgreSQL comparten la conexión: van juntos y en orden
+DB_CHECKS = ("pg", "pgvector", "schema")
+
+def _run_group(keys):
+    """Ejecuta chequeos en orden dentro de un hilo, capturando salida y duración"""
+    results = []
+    for key in keys:
+        func_name = CHECKS[key][1]
+        t0 = time.perf_counter()
+        try:
+            ok = globals()[func_name]()
+        except Exception as e:
+            print_error(f"Error inesperado: {type(e).__name__}: {e}")
+            ok = False
+        elapsed = time.perf_counter() - t0
+        buffer = _current_buffer()
+        results.append((key, ok, elapsed, list(buffer)))
+        buffer.clear()
+    return results
+
+def run_checks(selected):
+    """
+    Ejecuta (e importa) solo los chequeos solicitados.
+    'env' va primero porque carga el .env; el resto (PostgreSQL, SQLAlchemy,
+    FastAPI, OpenAI) espera red en paralelo y se imprime en el orden habitual
+    
+    Returns:
+        (results, timings): clave del chequeo -> OK / segundos
+    """
+    results = {}
+    timings = {}
+    
+    def collect(group_results):
+        for key, ok, elapsed, output in group_results:
+            results[key] = ok
+            timings[key] = elapsed
+            _write_lines(output)
+    
+    if "env" in selected:
+        collect(_run_group(["env"]))
     
-    # Resumen
+    rest = [key for key in selected if key != "env"]
+    db_keys = [key for key in rest if key in DB_CHECKS]
+    groups = ([db_keys] if db_keys else []) + [[key] for key in rest if key not in DB_CHECKS]
+    
+    if groups:
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            futures = [pool.submit(_run_group, group) for group in groups]
+            for future in futures:
+                collect(future.result())
+    return results, timings
+
+def print_summary(results):
     print_header("RESUMEN DE DIAGNÓSTICO")
     
     passed = sum(1 for v in results.values() if v)
     total = len(results)
     
-    for test, result in results.items():
+    for key, result in results.items():
+        label = CHECKS[key][0]
         if result:
-            print_success(f"{test}: OK")
+            print_success(f"{label}: OK")
         else:
-            print_error(f"{test}: FALLO")
+            print_error(f"{label}: FALLO")
     
-    print(f"\n{Colors.BOLD}Resultado: {passed}/{total} tests pasaron{Colors.RESET}\n")
+    _emit(f"\n{Colors.BOLD}Resultado: {passed}/{total} tests pasaron{Colors.RESET}\n")
     
     if passed == total:
-        print(f"{Colors.GREEN}{Colors.BOLD}✅ ¡SISTEMA COMPLETAMENTE FUNCIONAL!{Colors.RESET}\n")
-        print(f"{Colors.CYAN}Siguiente paso:{Colors.RESET}")
-        print("   • Abre: http://localhost:8088/docs")
-        print("   • O usa: smart_health_chat.html\n")
+        _emit(f"{Colors.GREEN}{Colors.BOLD}✅ ¡SISTEMA COMPLETAMENTE FUNCIONAL!{Colors.RESET}\n")
+        _emit(f"{Colors.CYAN}Siguiente paso:{Colors.RESET}")
+        _emit("   • Abre: http://localhost:8088/docs")
+        _emit("   • O usa: smart_health_chat.html\n")
     else:
-        print(f"{Colors.RED}{Colors.BOLD}❌ HAY PROBLEMAS QUE RESOLVER{Colors.RESET}\n")
-        print(f"{Colors.YELLOW}Revisa los mensajes de error arriba para soluciones específicas{Colors.RESET}\n")
+        _emit(f"{Colors.RED}{Colors.BOLD}❌ HAY PROBLEMAS QUE RESOLVER{Colors.RESET}\n")
+        _emit(f"{Colors.YELLOW}Revisa los mensajes de error arriba para soluciones específicas{Colors.RESET}\n")
+
+def print_json(results, timings):
+    """Resumen para orquestadores (CI, monitores): un objeto JSON por línea"""
+    passed = sum(1 for v in results.values() if v)
+    sys.stdout.write(json.dumps({
+        "results": results,
+        "timings": {key: round(t, 4) for key, t in timings.items()},
+        "passed": passed,
+        "total": len(results)
+    }) + "\n")
+    sys.stdout.flush()
+    return passed == len(results)
+
+def main(argv=None):
+    global _use_prepared, _quiet
+    
+    # Parsear argumentos antes de cualquier trabajo pesado
+    args = parse_args(argv)
+    selected = [args.only] if args.only else list(CHECKS)
+    _use_prepared = args.watch is not None
+    _quiet = args.json
+    
+    _emit(f"{Colors.CYAN}{Colors.BOLD}")
+    _emit("╔" + "="*68 + "╗")
+    _emit("║" + " "*68 + "║")
+    _emit("║" + "  🏥 SMARTHEALTH - DIAGNÓSTICO COMPLETO DEL SISTEMA".center(68) + "║")
+    _emit("║" + " "*68 + "║")
+    _emit("╚" + "="*68 + "╝")
+    _emit(f"{Colors.RESET}\n")
+    _flush_output()
+    
+    # En --watch la conexión compartida se mantiene entre iteraciones
+    try:
+        while True:
+            # Los demás chequeos necesitan las credenciales del .env (en
+            # --watch, un .env modificado se aplica en la siguiente vuelta)
+            if "env" not in selected:
+                load_env_file()
+            results, timings = run_checks(selected)
+            if args.json:
+                all_ok = print_json(results, timings)
+                if args.watch is None:
+                    sys.exit(0 if all_ok else 1)
+            else:
+                print_summary(results)
+            if args.watch is None:
+                break
+            print_info(f"Siguiente verificación en {args.watch}s (Ctrl+C para salir)")
+            _flush_output()
+            time.sleep(args.watch)
+    finally:
+        _close_shared_conn()
+        _flush_output()
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
+        _flush_output()
         print(f"\n\n{Colors.YELLOW}⚠️  Diagnóstico interrumpido{Colors.RESET}\n")
     except Exception as e:
+        _flush_output()
         print(f"\n{Colors.RED}❌ Error fatal: {type(e).__name__}: {e}{Colors.RESET}\n")
\ No newline at end of file
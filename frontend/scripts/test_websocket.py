@@ -8,6 +8,7 @@ import asyncio
 import websockets
 import json
 import sys
+import uuid
 from datetime import datetime
 
 
@@ -16,11 +17,15 @@ class WebSocketTester:
         self.uri = uri
         self.websocket = None
         self.test_results = []
+        # Respuestas pendientes por id de mensaje (pruebas concurrentes)
+        self._pending: dict[str, asyncio.Future] = {}
+        self._reader_task = None
         
     async def connect(self):
         """Establecer conexión WebSocket"""
         try:
             self.websocket = await websockets.connect(self.uri)
+            self._reader_task = asyncio.create_task(self._reader_loop())
             self.log_result("Connection", True, "WebSocket conectado exitosamente")
             return True
         except Exception as e:
@@ -29,27 +34,64 @@ class WebSocketTester:
     
     async def disconnect(self):
         """Cerrar conexión WebSocket"""
+        if self._reader_task:
+            self._reader_task.cancel()
         if self.websocket:
             await self.websocket.close()
             self.log_result("Disconnection", True, "WebSocket desconectado")
     
+    async def _reader_loop(self):
+        """Lee los mensajes entrantes y los entrega a la prueba que los espera"""
+        try:
+            async for raw in self.websocket:
+                message = json.loads(raw) if isinstance(raw, str) else raw
+                msg_id = message.get("id") if isinstance(message, dict) else None
+                
+                if msg_id in self._pending:
+                    future = self._pending.pop(msg_id)
+                elif self._pending:
+                    # Servidor sin eco del id: responde en orden de llegada
+                    future = self._pending.pop(next(iter(self._pending)))
+                else:
+                    continue
+                
+                if not future.done():
+                    future.set_result(message)
+        except Exception as e:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            self._pending.clear()
+    
     async def send_message(self, message):
-        """Enviar mensaje por WebSocket"""
+        """
+        Enviar mensaje por WebSocket.
+        
+        Returns:
+            id del mensaje (para receive_message) o None si falló
+        """
+        msg_id = uuid.uuid4().hex
         try:
             if isinstance(message, dict):
-                message = json.dumps(message)
+                message = json.dumps({"id": msg_id, **message})
+            # Registrar antes de enviar para no perder una respuesta rápida
+            self._pending[msg_id] = asyncio.get_running_loop().create_future()
             await self.websocket.send(message)
-            return True
+            return msg_id
         except Exception as e:
+            self._pending.pop(msg_id, None)
             self.log_result("Send Message", False, str(e))
-            return False
+            return None
     
-    async def receive_message(self, timeout=5):
-        """Recibir mensaje del WebSocket"""
+    async def receive_message(self, msg_id, timeout=5):
+        """Recibir la respuesta al mensaje indicado"""
+        future = self._pending.get(msg_id)
+        if future is None:
+            return None
         try:
-            message = await asyncio.wait_for(self.websocket.recv(), timeout=timeout)
-            return json.loads(message) if isinstance(message, str) else message
+            return await asyncio.wait_for(future, timeout=timeout)
         except asyncio.TimeoutError:
+            self._pending.pop(msg_id, None)
             self.log_result("Receive Message", False, "Timeout esperando mensaje")
             return None
         except Exception as e:
@@ -66,8 +108,9 @@ class WebSocketTester:
             }
         }
         
-        if await self.send_message(test_message):
-            response = await self.receive_message()
+        msg_id = await self.send_message(test_message)
+        if msg_id:
+            response = await self.receive_message(msg_id)
             if response:
                 self.log_result("Message Format", True, "Formato de mensaje válido")
             else:
@@ -80,8 +123,9 @@ class WebSocketTester:
             "token": "mock_jwt_token_12345"
         }
         
-        if await self.send_message(auth_message):
-            response = await self.receive_message()
+        msg_id = await self.send_message(auth_message)
+        if msg_id:
+            response = await self.receive_message(msg_id)
             if response:
                 self.log_result("Authentication", True, "Autenticación procesada")
             else:
@@ -92,8 +136,9 @@ class WebSocketTester:
         start_time = datetime.now()
         
         ping_message = {"type": "ping"}
-        if await self.send_message(ping_message):
-            response = await self.receive_message()
+        msg_id = await self.send_message(ping_message)
+        if msg_id:
+            response = await self.receive_message(msg_id)
             if response:
                 latency = (datetime.now() - start_time).total_seconds() * 1000
                 self.log_result("Latency", True, f"Latencia: {latency:.2f}ms")
@@ -136,9 +181,12 @@ class WebSocketTester:
             return
         
         try:
-            await self.test_message_format()
-            await self.test_authentication()
-            await self.test_latency()
+            # Las tres pruebas comparten la conexión y corren en paralelo
+            await asyncio.gather(
+                self.test_message_format(),
+                self.test_authentication(),
+                self.test_latency()
+            )
         finally:
             await self.disconnect()
         
@@ -3,12 +3,12 @@
 Servidor HTTP simple para el frontend de SmartHealth
 """
 import http.server
-import socketserver
-import os
 import sys
+from functools import partial
+from pathlib import Path
 
-# Cambiar al directorio del script
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+# Servir desde el directorio del script (sin os.chdir, que afecta a todo el proceso)
+FRONTEND_DIR = Path(__file__).resolve().parent
 
 PORT = 3000
 
@@ -19,7 +19,7 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', '*')
         super().end_headers()
-    
+
     def log_message(self, format, *args):
         # Log personalizado
         sys.stderr.write("%s - - [%s] %s\n" %
@@ -27,10 +27,16 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                          self.log_date_time_string(),
                          format%args))
 
+class DevHTTPServer(http.server.ThreadingHTTPServer):
+    """Un hilo por petición: el navegador descarga HTML, JS y CSS en paralelo"""
+    # SO_REUSEADDR: reiniciar sin esperar a que el puerto salga de TIME_WAIT
+    allow_reuse_address = True
+
 if __name__ == "__main__":
-    with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
+    handler = partial(MyHTTPRequestHandler, directory=str(FRONTEND_DIR))
+    with DevHTTPServer(("", PORT), handler) as httpd:
         print(f"Servidor HTTP ejecutándose en http://localhost:{PORT}")
-        print(f"Directorio: {os.getcwd()}")
+        print(f"Directorio: {FRONTEND_DIR}")
         print(f"Archivos disponibles:")
         print(f"  - http://localhost:{PORT}/public/index.html")
         print(f"  - http://localhost:{PORT}/public/test.html")
@@ -40,4 +46,3 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("\n\nServidor detenido.")
             sys.exit(0)
-
@@ -0,0 +1,90 @@
+"""Esquema base de la API: patients, users y audit_logs
+
+Equivale a lo que hacía Base.metadata.create_all al arrancar: crea solo las
+tablas que falten. En una base creada con los scripts de pipelines/ no hace
+nada más que registrar la revisión.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2025-12-15
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_baseline"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "smart_health"
+
+
+def upgrade() -> None:
+    op.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    existing = set(sa.inspect(op.get_bind()).get_table_names(schema=SCHEMA))
+
+    if "patients" not in existing:
+        op.create_table(
+            "patients",
+            sa.Column("patient_id", sa.Integer(), primary_key=True),
+            sa.Column("first_name", sa.String(50), nullable=False),
+            sa.Column("middle_name", sa.String(50)),
+            sa.Column("first_surname", sa.String(50), nullable=False),
+            sa.Column("second_surname", sa.String(50)),
+            sa.Column("birth_date", sa.Date(), nullable=False),
+            sa.Column("gender", sa.String(1), nullable=False),
+            sa.Column("email", sa.String(100), unique=True),
+            sa.Column("document_type_id", sa.Integer(), nullable=False),
+            sa.Column("document_number", sa.String(50), nullable=False),
+            sa.Column("registration_date", sa.TIMESTAMP()),
+            sa.Column("active", sa.Boolean()),
+            sa.Column("blood_type", sa.String(5)),
+            sa.CheckConstraint("gender IN ('M', 'F', 'O')"),
+            schema=SCHEMA,
+        )
+        op.create_index("ix_smart_health_patients_patient_id", "patients", ["patient_id"], schema=SCHEMA)
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("user_id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("first_name", sa.String(50), nullable=False),
+            sa.Column("middle_name", sa.String(50)),
+            sa.Column("first_surname", sa.String(50), nullable=False),
+            sa.Column("second_surname", sa.String(50)),
+            sa.Column("email", sa.String(100), nullable=False),
+            sa.Column("password_hash", sa.String(255), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            schema=SCHEMA,
+        )
+        op.create_index("ix_smart_health_users_user_id", "users", ["user_id"], schema=SCHEMA)
+        op.create_index("ix_smart_health_users_email", "users", ["email"], unique=True, schema=SCHEMA)
+
+    if "audit_logs" not in existing:
+        op.create_table(
+            "audit_logs",
+            sa.Column("audit_log_id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey(f"{SCHEMA}.users.user_id"), nullable=False),
+            sa.Column("session_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("sequence_chat_id", sa.Integer(), nullable=False),
+            sa.Column("document_type_id", sa.Integer(), nullable=False),
+            sa.Column("document_number", sa.String(30), nullable=False),
+            sa.Column("question", sa.Text(), nullable=False),
+            sa.Column("response_json", postgresql.JSONB(), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.func.now()),
+            schema=SCHEMA,
+        )
+        op.create_index("ix_smart_health_audit_logs_audit_log_id", "audit_logs", ["audit_log_id"], schema=SCHEMA)
+
+
+def downgrade() -> None:
+    # Las tablas pueden venir de los scripts de pipelines/: no se borran datos
+    pass
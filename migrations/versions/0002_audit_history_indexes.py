@@ -0,0 +1,56 @@
+"""Índices de audit_logs para los endpoints de historial
+
+Revision ID: 0002_audit_history_indexes
+Revises: 0001_baseline
+Create Date: 2025-12-16
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_audit_history_indexes"
+down_revision: Union[str, None] = "0001_baseline"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SCHEMA = "smart_health"
+
+
+def upgrade() -> None:
+    # CONCURRENTLY no puede ir dentro de una transacción; así no se bloquean
+    # las escrituras de audit_logs mientras se construyen
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_audit_user_created",
+            "audit_logs",
+            ["user_id", sa.text("created_at DESC")],
+            schema=SCHEMA,
+            postgresql_include=[
+                # sin question: el texto puede superar el límite de
+                # tamaño de una entrada de B-tree
+                "audit_log_id", "session_id", "sequence_chat_id",
+                "document_type_id", "document_number",
+            ],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_audit_user_session_seq",
+            "audit_logs",
+            ["user_id", "session_id", "sequence_chat_id"],
+            schema=SCHEMA,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_audit_user_session_seq", table_name="audit_logs", schema=SCHEMA,
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index("ix_audit_user_created", table_name="audit_logs", schema=SCHEMA,
+                      postgresql_concurrently=True, if_exists=True)
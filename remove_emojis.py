@@ -4,49 +4,122 @@ Script simple para eliminar todos los emojis de archivos Python
 NO requiere imports del proyecto
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import argparse
+import mmap
+import os
 import re
 from pathlib import Path
 
+# Rangos Unicode considerados emojis: disjuntos y acotados a los bloques
+# de pictogramas. De los bloques de texto (formas geométricas, flechas,
+# CJK) solo se incluyen los code points que son emoji; el resto (líneas
+# de cajas, ideogramas, flechas de texto) no se toca
+EMOJI_RANGES = [
+    (0x0231A, 0x0231B),  # reloj y reloj de arena
+    (0x02328, 0x02328),  # ⌨
+    (0x023CF, 0x023CF),  # ⏏
+    (0x023E9, 0x023F3),  # controles multimedia
+    (0x023F8, 0x023FA),
+    (0x024C2, 0x024C2),  # Ⓜ
+    (0x025AA, 0x025AB),  # ▪ ▫
+    (0x025B6, 0x025B6),  # ▶
+    (0x025C0, 0x025C0),  # ◀
+    (0x025FB, 0x025FE),  # ◻ ◼ ◽ ◾
+    (0x02600, 0x026FF),  # símbolos misceláneos
+    (0x02702, 0x027B0),  # dingbats
+    (0x027BF, 0x027BF),  # ➿
+    (0x02B05, 0x02B07),  # ⬅ ⬆ ⬇
+    (0x02B1B, 0x02B1C),  # cuadrados
+    (0x02B50, 0x02B50),  # estrella
+    (0x02B55, 0x02B55),  # círculo
+    (0x03030, 0x03030),  # 〰
+    (0x0303D, 0x0303D),  # 〽
+    (0x03297, 0x03297),  # ㊗
+    (0x03299, 0x03299),  # ㊙
+    (0x0FE0F, 0x0FE0F),  # selector de variación emoji
+    (0x1F004, 0x1F004),  # 🀄
+    (0x1F0CF, 0x1F0CF),  # 🃏
+    (0x1F170, 0x1F251),  # letras encerradas, banderas e ideogramas
+    (0x1F300, 0x1F5FF),  # símbolos y pictogramas
+    (0x1F600, 0x1F64F),  # emoticons
+    (0x1F680, 0x1F6FF),  # transporte y símbolos de mapa
+    (0x1F7E0, 0x1F7EB),  # círculos y cuadrados de colores
+    (0x1F900, 0x1F9FF),  # símbolos suplementarios
+    (0x1FA70, 0x1FAFF),  # símbolos extendidos
+]
+
+def _utf8_sequences(lo: int, hi: int) -> list:
+    """
+    Convierte un rango de code points en alternativas de bytes UTF-8
+    (una clase de bytes por posición)
+    """
+    # Separar por longitud de la codificación (1, 2, 3 o 4 bytes)
+    for bound in (0x7F, 0x7FF, 0xFFFF):
+        if lo <= bound < hi:
+            return _utf8_sequences(lo, bound) + _utf8_sequences(bound + 1, hi)
+    
+    # Alinear el rango a los bytes de continuación
+    for i in range(1, 4):
+        mask = (1 << (6 * i)) - 1
+        if lo & ~mask != hi & ~mask:
+            if lo & mask:
+                return _utf8_sequences(lo, lo | mask) + _utf8_sequences((lo | mask) + 1, hi)
+            if hi & mask != mask:
+                return _utf8_sequences(lo, (hi & ~mask) - 1) + _utf8_sequences(hi & ~mask, hi)
+    
+    start = chr(lo).encode('utf-8', 'surrogatepass')
+    end = chr(hi).encode('utf-8', 'surrogatepass')
+    return [b''.join(b'[\\x%02x-\\x%02x]' % pair for pair in zip(start, end))]
+
 # Patrón regex para detectar emojis
 EMOJI_PATTERN = re.compile(
-    "["
-    "\U0001F600-\U0001F64F"  # emoticons
-    "\U0001F300-\U0001F5FF"  # símbolos y pictogramas
-    "\U0001F680-\U0001F6FF"  # transporte y símbolos de mapa
-    "\U0001F1E0-\U0001F1FF"  # banderas
-    "\U00002702-\U000027B0"  # dingbats
-    "\U000024C2-\U0001F251"
-    "\U0001F900-\U0001F9FF"  # símbolos suplementarios
-    "\U0001FA70-\U0001FAFF"  # símbolos extendidos
-    "]+",
+    "[" + "".join(f"{chr(lo)}-{chr(hi)}" for lo, hi in EMOJI_RANGES) + "]+",
     flags=re.UNICODE
 )
 
+# Mismo patrón sobre bytes UTF-8: permite descartar (o contar, en --dry-run)
+# sin decodificar. Coincide por rachas, igual que EMOJI_PATTERN.subn
+EMOJI_PATTERN_BYTES = re.compile(
+    b"(?:" + b"|".join(seq for lo, hi in EMOJI_RANGES for seq in _utf8_sequences(lo, hi)) + b")+"
+)
+
 def remove_emojis(text: str) -> str:
     """Elimina todos los emojis de un texto"""
     return EMOJI_PATTERN.sub('', text)
 
-def process_file(file_path: Path) -> tuple:
+def process_file(file_path: Path, dry_run: bool = False) -> tuple:
     """
     Procesa un archivo eliminando emojis
     
+    Args:
+        dry_run: Solo contar sobre los bytes mapeados (no decodifica ni escribe)
+    
     Returns:
         (changed, emoji_count): Si hubo cambios y cuántos emojis se eliminaron
     """
     try:
-        # Leer archivo
-        with open(file_path, 'r', encoding='utf-8') as f:
-            original_content = f.read()
-        
-        # Eliminar emojis
-        cleaned_content = remove_emojis(original_content)
+        with open(file_path, 'rb') as f:
+            # mmap no admite archivos vacíos
+            if os.fstat(f.fileno()).st_size == 0:
+                return False, 0
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Camino rápido: sin emojis no se decodifica nada
+                if EMOJI_PATTERN_BYTES.search(mm) is None:
+                    return False, 0
+                if dry_run:
+                    emoji_count = sum(1 for _ in EMOJI_PATTERN_BYTES.finditer(mm))
+                    return True, emoji_count
+                original_content = mm[:].decode('utf-8')
         
-        # Contar emojis eliminados
-        emoji_count = len(EMOJI_PATTERN.findall(original_content))
+        # Eliminar y contar emojis en una sola pasada
+        cleaned_content, emoji_count = EMOJI_PATTERN.subn('', original_content)
         
-        # Si hubo cambios, escribir archivo
-        if cleaned_content != original_content:
-            with open(file_path, 'w', encoding='utf-8') as f:
+        # Si hubo cambios, escribir archivo (conservando los saltos de línea)
+        if emoji_count:
+            with open(file_path, 'w', encoding='utf-8', newline='') as f:
                 f.write(cleaned_content)
             return True, emoji_count
         
@@ -56,9 +129,10 @@ def process_file(file_path: Path) -> tuple:
         print(f"[ERROR] procesando {file_path}: {e}")
         return False, 0
 
-def clean_project(root_dir: str = "src") -> dict:
+def clean_project(root_dir: str = "src", dry_run: bool = False) -> dict:
     """
     Limpia todos los archivos .py del proyecto
+    (con dry_run solo cuenta, sin modificar nada)
     
     Returns:
         Diccionario con estadísticas
@@ -81,11 +155,14 @@ def clean_project(root_dir: str = "src") -> dict:
         "files_processed": []
     }
     
-    # Buscar todos los archivos .py
-    for py_file in root.rglob("*.py"):
-        stats["total_files"] += 1
-        changed, emoji_count = process_file(py_file)
-        
+    # Buscar todos los archivos .py y procesarlos en paralelo (CPU-bound)
+    files = list(root.rglob("*.py"))
+    stats["total_files"] = len(files)
+    
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(partial(process_file, dry_run=dry_run), files, chunksize=16))
+    
+    for py_file, (changed, emoji_count) in zip(files, results):
         if changed:
             stats["files_changed"] += 1
             stats["total_emojis_removed"] += emoji_count
@@ -93,7 +170,10 @@ def clean_project(root_dir: str = "src") -> dict:
                 "file": str(py_file.relative_to(root)),
                 "emojis_removed": emoji_count
             })
-            print(f"[OK] {py_file.name}: {emoji_count} emojis eliminados")
+            if dry_run:
+                print(f"[DRY-RUN] {py_file.name}: {emoji_count} emojis encontrados")
+            else:
+                print(f"[OK] {py_file.name}: {emoji_count} emojis eliminados")
     
     return stats
 
@@ -117,16 +197,27 @@ def print_report(stats: dict):
     print("\n" + "=" * 70)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Elimina emojis de los archivos .py")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Solo contar emojis, sin modificar archivos"
+    )
+    args = parser.parse_args()
+    
     print("Iniciando limpieza de emojis...\n")
     
     # Limpiar proyecto
-    stats = clean_project("src")
+    stats = clean_project("src", dry_run=args.dry_run)
     
     # Mostrar reporte
     print_report(stats)
     
+    if args.dry_run:
+        print("\n[DRY-RUN] No se modificó ningún archivo")
+    
     # Sugerencias finales
-    if stats["files_changed"] > 0:
+    elif stats["files_changed"] > 0:
         print("\nProximos pasos:")
         print("  1. git add .")
         print('  2. git commit -m "refactor: eliminar emojis del codigo"')
@@ -0,0 +1,64 @@
+# src/app/core/logging_config.py
+
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+from app.database.db_config import settings
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que registra.
+    El QueueHandler estándar llama a format() en prepare() para poder
+    serializar el registro entre procesos; con una cola en memoria basta con
+    encolar el LogRecord y el formateo ocurre en el hilo del listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro (orjson), para agregadores de logs"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry).decode()
+
+
+def setup_logging(level: int = logging.INFO) -> QueueListener:
+    """
+    Configura el logger raíz para que solo encole los registros.
+    Un QueueListener en segundo plano los formatea y escribe en stderr.
+
+    Returns:
+        El listener ya iniciado (detenerlo en el shutdown para vaciar la cola)
+    """
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if settings.log_json:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+
+    root = logging.getLogger()
+    root.handlers[:] = [_DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,78 @@
+# src/app/core/middleware.py
+
+import logging
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.database.db_config import settings
+
+logger = logging.getLogger(__name__)
+
+# Headers de seguridad solo en producción: se decide una vez al importar y se
+# guardan ya codificados para añadirlos tal cual a la lista raw de headers
+_PROD_SEC_HEADERS = (
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000"),
+) if settings.app_env == "production" else ()
+
+
+# ============================================================
+# MIDDLEWARES ASGI
+# ============================================================
+# ASGI puro en lugar de @app.middleware("http"): BaseHTTPMiddleware añade
+# una capa de corrutinas y re-empaqueta el cuerpo de cada respuesta.
+# Aquí solo se envuelve `send` para tocar el mensaje http.response.start.
+
+
+class SecurityHeadersMiddleware:
+    """Agrega headers de seguridad a las respuestas HTTP (solo en producción)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Fuera de producción no hay nada que añadir: sin envolver `send`
+        if scope["type"] != "http" or not _PROD_SEC_HEADERS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *_PROD_SEC_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class RequestLoggingMiddleware:
+    """Registra método, ruta, status y tiempo de cada petición HTTP"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        start_time = time.perf_counter()
+
+        # Log request
+        logger.info(f"Request: {scope['method']} {path}")
+
+        async def send_with_logging(message: Message):
+            if message["type"] == "http.response.start":
+                # Log response (mismo punto en que call_next devolvía la respuesta)
+                process_time = time.perf_counter() - start_time
+                logger.info(
+                    f"Response: {message['status']} "
+                    f"Time: {process_time:.3f}s "
+                    f"Path: {path}"
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_logging)
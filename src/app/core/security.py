@@ -1,15 +1,23 @@
 # app/core/security.py
 
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import Optional
-from jose import JWTError, jwt
+from threading import Lock
+import asyncio
+import hashlib
+import os
+import time
+from cachetools import TTLCache
+import jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from ..database.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database.database import get_async_db
 from ..models.user import User
 from ..database.db_config import settings
+from ..services.user_cache import get_cached_user
 import secrets
 
 # SEGURIDAD: Usar variable de entorno en lugar de hardcodear
@@ -21,12 +29,38 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 if len(SECRET_KEY) < 32:
     raise ValueError("SECRET_KEY debe tener al menos 32 caracteres")
 
-# Contexto de encriptación para passwords
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Clave HMAC ya en bytes, preparada una sola vez. PyJWT firma/verifica HS256
+# con hmac de la stdlib (OpenSSL). Rotar SECRET_KEY exige reiniciar
+SIGNING_KEY = SECRET_KEY.encode("utf-8")
+
+# Contexto de encriptación para passwords. Los hashes con otro costo siguen
+# verificando; los nuevos usan BCRYPT_ROUNDS
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    bcrypt__rounds=settings.bcrypt_rounds,
+    deprecated="auto"
+)
+
+# bcrypt es CPU-bound y libera el GIL: pool propio del tamaño de los núcleos,
+# para no ocupar el threadpool compartido con el resto de rutas síncronas
+_hash_executor = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 1,
+    thread_name_prefix="bcrypt"
+)
 
 # Configuración de Bearer token
 security = HTTPBearer()
 
+# Payloads ya verificados, por token: evita repetir base64/JSON/HMAC para
+# el mismo token (polling, reconexiones HTTP y WebSocket). La firma se valida
+# en el primer uso. La clave es el SHA-256 del token, no el token en claro
+_decode_cache = TTLCache(maxsize=10_000, ttl=30)
+_decode_cache_lock = Lock()
+
+
+def _decode_cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
 
 # ============================================================
 # FUNCIONES DE HASHING DE CONTRASEÑAS
@@ -59,6 +93,24 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def hash_password_async(password: str) -> str:
+    """
+    Igual que hash_password, pero sin bloquear el event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Igual que verify_password, pero sin bloquear el event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _hash_executor, verify_password, plain_password, hashed_password
+    )
+
+
 # ============================================================
 # FUNCIONES DE JWT
 # ============================================================
@@ -76,17 +128,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     """
     to_encode = data.copy()
     
+    # exp como entero Unix (RFC 7519): sin objetos datetime intermedios
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        lifetime = int(expires_delta.total_seconds())
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        lifetime = ACCESS_TOKEN_EXPIRE_MINUTES * 60
     
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode["exp"] = int(time.time()) + lifetime
+    encoded_jwt = jwt.encode(to_encode, SIGNING_KEY, algorithm=ALGORITHM)
     
     return encoded_jwt
 
 
+def get_cached_token_payload(token: str) -> Optional[dict]:
+    """
+    Payload de un token ya verificado y aún vigente, solo desde la caché
+    (sin verificar la firma). None si no está en caché o expiró.
+    """
+    with _decode_cache_lock:
+        payload = _decode_cache.get(_decode_cache_key(token))
+    
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    return None
+
+
 def decode_access_token(token: str) -> Optional[dict]:
     """
     Decodifica y valida un token JWT.
@@ -97,20 +163,33 @@ def decode_access_token(token: str) -> Optional[dict]:
     Returns:
         Payload del token si es válido, None si no
     """
+    cache_key = _decode_cache_key(token)
+    with _decode_cache_lock:
+        payload = _decode_cache.get(cache_key)
+    
+    if payload is not None:
+        # En caché solo queda revalidar la expiración
+        if payload.get("exp", 0) > time.time():
+            return payload
+        return None
+    
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+        payload = jwt.decode(token, SIGNING_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
         return None
+    
+    with _decode_cache_lock:
+        _decode_cache[cache_key] = payload
+    return payload
 
 
 # ============================================================
 # DEPENDENCY PARA OBTENER USUARIO ACTUAL
 # ============================================================
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Dependency para obtener el usuario autenticado actual.
@@ -140,14 +219,18 @@ def get_current_user(
     if payload is None:
         raise credentials_exception
     
-    # Obtener user_id del payload
-    user_id: str = payload.get("sub")
+    # Obtener user_id del payload: claim entero "uid", sin int() ni excepciones
+    user_id = payload.get("uid")
     
-    if user_id is None:
-        raise credentials_exception
+    if not isinstance(user_id, int):
+        # Tokens emitidos antes de "uid": solo "sub" como string numérico
+        sub = payload.get("sub")
+        if not isinstance(sub, str) or not sub.isdigit():
+            raise credentials_exception
+        user_id = int(sub)
     
-    # Buscar usuario en la base de datos
-    user = db.query(User).filter(User.user_id == int(user_id)).first()
+    # Buscar usuario (caché en memoria, base de datos si no está)
+    user = await get_cached_user(db, user_id)
     
     if user is None:
         raise credentials_exception
@@ -162,18 +245,6 @@ def get_current_user(
     return user
 
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
-    """
-    Dependency adicional que verifica que el usuario esté activo.
-    """
-    if not current_user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Usuario inactivo"
-        )
-    return current_user
-
-
 # ============================================================
 # FUNCIONES DE UTILIDAD PARA SEGURIDAD
 # ============================================================
@@ -183,9 +254,9 @@ def generate_secure_token(length: int = 32) -> str:
     Genera un token seguro aleatorio.
     
     Args:
-        length: Longitud del token en bytes
+        length: Bytes aleatorios (entropía), no longitud del texto
         
     Returns:
-        Token hexadecimal seguro
+        Token seguro en base64url (~1.33 caracteres por byte frente a 2 en hex)
     """
-    return secrets.token_hex(length)
\ No newline at end of file
+    return secrets.token_urlsafe(length)
\ No newline at end of file
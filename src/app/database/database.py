@@ -1,5 +1,10 @@
 # app/database/database.py
-from sqlalchemy import create_engine
+from uuid import uuid4
+
+import orjson
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .db_config import settings
 
@@ -8,7 +13,74 @@ DATABASE_URL = (
     f"{settings.db_host}:{settings.db_port}/{settings.db_name}"
 )
 
-engine = create_engine(DATABASE_URL, echo=True)
+# Presupuesto de conexiones por worker (DB_POOL_BUDGET, máximo simultáneo),
+# repartido entre los tres pools del proceso:
+#   motor asíncrono   40%  (get_current_user, /auth, /users, chat WebSocket,
+#                           historial por sesión)
+#   motor síncrono    40%  (/query, escritura de auditoría)
+#   pool asyncpg      20%  (GET /history/, ver pg_pool)
+# Por defecto 20: con 4 workers son 80 conexiones, dentro del
+# max_connections=100 de PostgreSQL con margen para administración y
+# pipelines. Al cambiar el número de workers, ajustar para que
+# workers × DB_POOL_BUDGET quede por debajo de max_connections.
+POOL_BUDGET = max(settings.db_pool_budget, 3)
+ASYNC_POOL_CONNECTIONS = POOL_BUDGET * 2 // 5
+PG_POOL_MAX_SIZE = max(POOL_BUDGET // 5, 1)
+SYNC_POOL_CONNECTIONS = POOL_BUDGET - ASYNC_POOL_CONNECTIONS - PG_POOL_MAX_SIZE
+
+
+# Mitad fija y mitad overflow. echo solo en desarrollo: loguear cada
+# sentencia cuesta formateo e I/O por consulta. pool_timeout corto: si el
+# pool se agota, fallar en 5s en vez de los 30s por defecto. Detrás de
+# PgBouncer el pool lo lleva PgBouncer
+def _pool_args(connections: int) -> dict:
+    if settings.db_pgbouncer:
+        return {"poolclass": NullPool}
+    pool_size = max(connections // 2, 1)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max(connections - pool_size, 0),
+        "pool_timeout": 5,
+        "pool_pre_ping": True,   # descarta conexiones cerradas por timeouts de PG
+        "pool_recycle": 3600,
+    }
+
+# Tope por sentencia en el servidor. Sin PgBouncer va como parámetro de
+# arranque de cada conexión; PgBouncer rechaza esos parámetros (options,
+# server_settings), así que detrás de él se fija con SET LOCAL al empezar
+# cada transacción: no se queda en la conexión del servidor que PgBouncer
+# pasa luego a otro cliente
+STATEMENT_TIMEOUT_MS = 5000
+SET_LOCAL_STATEMENT_TIMEOUT = f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}"
+# Para asyncpg (server_settings) sin PgBouncer
+SERVER_SETTINGS = {} if settings.db_pgbouncer else {"statement_timeout": str(STATEMENT_TIMEOUT_MS)}
+
+
+def _set_statement_timeout(conn) -> None:
+    conn.exec_driver_sql(SET_LOCAL_STATEMENT_TIMEOUT)
+
+
+# Columnas JSON/JSONB (p. ej. audit_logs.response_json) con orjson en lugar
+# del json de la stdlib. OPT_NON_STR_KEYS: claves no str como hace json.dumps
+def _json_serializer(obj) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+JSON_ARGS = {"json_serializer": _json_serializer, "json_deserializer": orjson.loads}
+
+engine = create_engine(
+    DATABASE_URL,
+    echo=settings.app_env == "development",
+    echo_pool=False,
+    connect_args=(
+        {} if settings.db_pgbouncer
+        else {"options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"}
+    ),
+    **JSON_ARGS,
+    **_pool_args(SYNC_POOL_CONNECTIONS)
+)
+if settings.db_pgbouncer:
+    event.listen(engine, "begin", _set_statement_timeout)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,3 +90,32 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Motor asíncrono (asyncpg) para las rutas async: esperan a la BD sin ocupar
+# un hilo del threadpool. Convive con el síncrono mientras se migran las rutas
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=settings.app_env == "development",
+    connect_args={
+        "server_settings": SERVER_SETTINGS,
+        # PgBouncer en modo transaction no admite prepared statements con
+        # nombre fijo: sin caché de asyncpg ni la del dialecto de SQLAlchemy,
+        # y con nombres únicos para los que el dialecto sigue preparando
+        **({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        } if settings.db_pgbouncer else {}),
+    },
+    **JSON_ARGS,
+    **_pool_args(ASYNC_POOL_CONNECTIONS)
+)
+if settings.db_pgbouncer:
+    event.listen(async_engine.sync_engine, "begin", _set_statement_timeout)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -17,6 +17,10 @@ class Settings(BaseSettings):
     # === CONFIGURACIÓN DE SEGURIDAD ===
     secret_key: str
     app_env: str = "production"
+    bcrypt_rounds: int = 12  # medir con benchmark_bcrypt.py antes de cambiarlo
+    log_json: bool = False  # LOG_JSON=true: una línea JSON por registro
+    db_pgbouncer: bool = False  # DB_PGBOUNCER=true: sin pool propio (PgBouncer en modo transaction)
+    db_pool_budget: int = 20  # DB_POOL_BUDGET: conexiones máximas a PostgreSQL por worker
     
     # === CONFIGURACIÓN DEL LLM ===
     openai_api_key: str
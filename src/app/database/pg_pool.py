@@ -0,0 +1,63 @@
+# app/database/pg_pool.py
+import asyncio
+from typing import List, Optional
+
+import asyncpg
+
+from .database import DATABASE_URL, PG_POOL_MAX_SIZE, SERVER_SETTINGS, SET_LOCAL_STATEMENT_TIMEOUT
+from .db_config import settings
+
+# Pool de asyncpg sin SQLAlchemy, para las consultas más frecuentes y de
+# forma fija (historial): filas como Record, sin compilar SQL ni mapear ORM.
+# asyncpg prepara cada sentencia una vez por conexión y la reutiliza
+# (statement cache); detrás de PgBouncer en modo transaction se desactiva.
+# Tamaño: su parte del presupuesto de conexiones por worker (database.py).
+# Con PgBouncer no se mantienen conexiones abiertas: como el NullPool de los
+# motores, se crean bajo demanda y las inactivas se cierran enseguida
+if settings.db_pgbouncer:
+    _POOL_SIZE_ARGS = {
+        "min_size": 0, "max_size": PG_POOL_MAX_SIZE, "max_inactive_connection_lifetime": 10,
+    }
+else:
+    _POOL_SIZE_ARGS = {"min_size": min(2, PG_POOL_MAX_SIZE), "max_size": PG_POOL_MAX_SIZE}
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pg_pool() -> asyncpg.Pool:
+    """Devuelve el pool, creándolo en el primer uso."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    **_POOL_SIZE_ARGS,
+                    statement_cache_size=0 if settings.db_pgbouncer else 100,
+                    server_settings=SERVER_SETTINGS,
+                )
+    return _pool
+
+
+async def pg_fetch(query: str, *args) -> List[asyncpg.Record]:
+    """
+    pool.fetch con el statement_timeout aplicado también detrás de PgBouncer,
+    donde no puede ir como parámetro de arranque: ahí la consulta va en una
+    transacción con SET LOCAL.
+    """
+    pool = await get_pg_pool()
+    if not settings.db_pgbouncer:
+        return await pool.fetch(query, *args)
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(SET_LOCAL_STATEMENT_TIMEOUT)
+            return await conn.fetch(query, *args)
+
+
+async def close_pg_pool() -> None:
+    """Cierra el pool (evento shutdown)."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
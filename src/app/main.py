@@ -3,10 +3,11 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import ORJSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+import asyncio
 import logging
 import time
 from typing import Dict
@@ -16,27 +17,33 @@ from pathlib import Path
 from .routers import auth, user, query, websocket_chat, history
 from .database.database import Base, engine
 from .database.db_config import settings
+from .services.audit_writer import audit_writer
+from .database.pg_pool import close_pg_pool
+from .core.middleware import SecurityHeadersMiddleware, RequestLoggingMiddleware
+from .core.logging_config import setup_logging
 
-# Configuración de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configuración de logging: las peticiones solo encolan los registros,
+# un hilo en segundo plano los formatea y escribe
+log_listener = setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Crear tablas en la base de datos
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Tablas de base de datos creadas exitosamente")
-except Exception as e:
-    logger.error(f"Error creando tablas: {str(e)}")
-    raise
+# Crear tablas solo en desarrollo: en producción el esquema lo gestiona
+# Alembic (alembic upgrade head) una vez antes de arrancar los workers
+if settings.app_env == "development":
+    try:
+        Base.metadata.create_all(bind=engine)
+        logger.info("Tablas de base de datos creadas exitosamente")
+    except Exception as e:
+        logger.error(f"Error creando tablas: {str(e)}")
+        raise
 
 # Crear aplicación con CDN alternativas para Swagger
 app = FastAPI(
     title="SmartHealth API",
     description="API REST y WebSocket para sistema de gestión de salud con RAG",
     version="2.0.0",
+    # orjson para todas las respuestas (más rápido que json de la stdlib)
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.app_env == "development" else None,
     redoc_url="/redoc" if settings.app_env == "development" else None,
     openapi_url="/openapi.json" if settings.app_env == "development" else None,
@@ -61,38 +68,10 @@ app.add_middleware(
 )
 
 # 2. Security Headers Middleware
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    
-    # Headers de seguridad solo en producción
-    if settings.app_env == "production":
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000"
-    
-    return response
+app.add_middleware(SecurityHeadersMiddleware)
 
 # 3. Request Logging Middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    
-    # Log request
-    logger.info(f"Request: {request.method} {request.url.path}")
-    
-    response = await call_next(request)
-    
-    # Log response
-    process_time = time.time() - start_time
-    logger.info(
-        f"Response: {response.status_code} "
-        f"Time: {process_time:.3f}s "
-        f"Path: {request.url.path}"
-    )
-    
-    return response
+app.add_middleware(RequestLoggingMiddleware)
 
 # ============================================================
 # EXCEPTION HANDLERS
@@ -102,7 +81,7 @@ async def log_requests(request: Request, call_next):
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     """Maneja excepciones HTTP de forma segura"""
     logger.warning(f"HTTP Exception: {exc.status_code} - {exc.detail}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "status": "error",
@@ -117,7 +96,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Maneja errores de validación de Pydantic"""
     logger.warning(f"Validation Error: {exc.errors()}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
             "status": "error",
@@ -136,7 +115,7 @@ async def general_exception_handler(request: Request, exc: Exception):
     
     # En desarrollo, mostrar más detalles
     if settings.app_env == "development":
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={
                 "status": "error",
@@ -149,7 +128,7 @@ async def general_exception_handler(request: Request, exc: Exception):
         )
     
     # En producción, mensaje genérico
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "status": "error",
@@ -178,6 +157,9 @@ app.include_router(history.router)
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 FRONTEND_DIR = BASE_DIR / "frontend"
 
+# Con páginas públicas, "/" es la redirección a /login en lugar del JSON informativo
+SERVE_FRONTEND = (FRONTEND_DIR / "public").exists()
+
 # Servir archivos estáticos (CSS, JS, imágenes)
 if FRONTEND_DIR.exists():
     static_dir = FRONTEND_DIR / "static"
@@ -187,41 +169,48 @@ if FRONTEND_DIR.exists():
     
     # Servir archivos públicos (HTML)
     public_dir = FRONTEND_DIR / "public"
-    if public_dir.exists():
+    if SERVE_FRONTEND:
         app.mount("/public", StaticFiles(directory=str(public_dir)), name="public")
         logger.info(f"Archivos públicos montados desde: {public_dir}")
         
+        # Existencia de las páginas comprobada una sola vez al arrancar;
+        # FileResponse ya hace su propio stat al enviar el archivo
+        def _page(name: str):
+            path = public_dir / name
+            return str(path) if path.is_file() else None
+
+        CHAT_PAGE = _page("index.html")
+        LOGIN_PAGE = _page("login.html")
+        REGISTER_PAGE = _page("register.html")
+        UNAUTHORIZED_PAGE = _page("unauthorized.html")
+
         # Servir páginas del frontend
         @app.get("/chat", tags=["Frontend"])
         async def serve_chat():
             """Sirve la aplicación de chat"""
-            index_path = public_dir / "index.html"
-            if index_path.exists():
-                return FileResponse(str(index_path))
+            if CHAT_PAGE:
+                return FileResponse(CHAT_PAGE)
             raise StarletteHTTPException(status_code=404, detail="Frontend no encontrado")
         
         @app.get("/login", tags=["Frontend"])
         async def serve_login():
             """Sirve la página de login"""
-            login_path = public_dir / "login.html"
-            if login_path.exists():
-                return FileResponse(str(login_path))
+            if LOGIN_PAGE:
+                return FileResponse(LOGIN_PAGE)
             raise StarletteHTTPException(status_code=404, detail="Página de login no encontrada")
         
         @app.get("/register", tags=["Frontend"])
         async def serve_register():
             """Sirve la página de registro"""
-            register_path = public_dir / "register.html"
-            if register_path.exists():
-                return FileResponse(str(register_path))
+            if REGISTER_PAGE:
+                return FileResponse(REGISTER_PAGE)
             raise StarletteHTTPException(status_code=404, detail="Página de registro no encontrada")
         
         @app.get("/unauthorized", tags=["Frontend"])
         async def serve_unauthorized():
             """Sirve la página de contenido no disponible"""
-            unauthorized_path = public_dir / "unauthorized.html"
-            if unauthorized_path.exists():
-                return FileResponse(str(unauthorized_path))
+            if UNAUTHORIZED_PAGE:
+                return FileResponse(UNAUTHORIZED_PAGE)
             raise StarletteHTTPException(status_code=404, detail="Página no encontrada")
         
         # Redirigir raíz a /login
@@ -235,27 +224,29 @@ if FRONTEND_DIR.exists():
 # ENDPOINTS PRINCIPALES
 # ============================================================
 
-@app.get("/", tags=["Root"])
-def root():
-    """Endpoint raíz con información de la API"""
-    return {
-        "message": "API SmartHealth funcionando correctamente",
-        "version": "2.0.0",
-        "environment": settings.app_env,
-        "features": {
-            "rest_api": True,
-            "websocket": True,
-            "rag_enabled": True,
-            "streaming": True,
-            "authentication": True
-        },
-        "endpoints": {
-            "docs": "/docs" if settings.app_env == "development" else None,
-            "redoc": "/redoc" if settings.app_env == "development" else None,
-            "websocket": "ws://localhost:8000/ws/chat",
-            "health": "/health"
+# Sin frontend: una sola ruta "/" con información de la API
+if not SERVE_FRONTEND:
+    @app.get("/", tags=["Root"])
+    def root():
+        """Endpoint raíz con información de la API"""
+        return {
+            "message": "API SmartHealth funcionando correctamente",
+            "version": "2.0.0",
+            "environment": settings.app_env,
+            "features": {
+                "rest_api": True,
+                "websocket": True,
+                "rag_enabled": True,
+                "streaming": True,
+                "authentication": True
+            },
+            "endpoints": {
+                "docs": "/docs" if settings.app_env == "development" else None,
+                "redoc": "/redoc" if settings.app_env == "development" else None,
+                "websocket": "ws://localhost:8000/ws/chat",
+                "health": "/health"
+            }
         }
-    }
 
 # src/app/main.py - Reemplazar el endpoint /health con esta versión corregida
 
@@ -319,9 +310,16 @@ async def startup_event():
     logger.info(f"Entorno: {settings.app_env}")
     logger.info(f"Modelo LLM: {settings.llm_model}")
     logger.info(f"Base de datos: {settings.db_host}:{settings.db_port}/{settings.db_name}")
+    logger.info(f"Event loop: {type(asyncio.get_running_loop()).__module__}")
     logger.info("=" * 60)
+    audit_writer.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Eventos al cerrar la aplicación"""
-    logger.info("SmartHealth API cerrando")
\ No newline at end of file
+    logger.info("SmartHealth API cerrando")
+    # Escribir los audit_logs que aún estén en cola
+    await audit_writer.stop()
+    await close_pg_pool()
+    # Vaciar la cola de logs antes de salir
+    log_listener.stop()
\ No newline at end of file
@@ -1,14 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from ..database.database import Base
 
 
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
-    __table_args__ = {"schema": "smart_health"}
 
     audit_log_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("smart_health.users.user_id"), nullable=False)
@@ -17,8 +16,30 @@ class AuditLog(Base):
     document_type_id = Column(Integer, nullable=False)
     document_number = Column(String(30), nullable=False)
     question = Column(Text, nullable=False)
-    response_json = Column(JSONB, nullable=False)
+    # Diferida: solo se carga si se pide explícitamente (puede ser grande)
+    response_json = deferred(Column(JSONB, nullable=False))
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    # Índices de /history (migración 0002_audit_history_indexes)
+    __table_args__ = (
+        # GET /history/: recorrido en orden del índice que termina en el LIMIT.
+        # question (Text) no va en el INCLUDE: una pregunta larga con
+        # caracteres multibyte superaría el tamaño máximo de una entrada de
+        # B-tree y haría fallar el INSERT; leerla del heap para LIMIT filas
+        # es barato
+        Index(
+            "ix_audit_user_created",
+            user_id,
+            created_at.desc(),
+            postgresql_include=[
+                "audit_log_id", "session_id", "sequence_chat_id",
+                "document_type_id", "document_number",
+            ],
+        ),
+        # GET /history/session/{id}: filas de la sesión ya en orden
+        Index("ix_audit_user_session_seq", user_id, session_id, sequence_chat_id),
+        {"schema": "smart_health"},
+    )
+
     # relación con users
     user = relationship("User", back_populates="audit_logs")
\ No newline at end of file
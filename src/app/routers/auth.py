@@ -1,9 +1,9 @@
 # src/app/routers/auth.py
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.user import UserCreate, UserLogin, UserResponse, TokenResponse
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.services.auth_service import AuthService  # ← Import directo
 
 router = APIRouter(
@@ -19,7 +19,7 @@ router = APIRouter(
     summary="Registrar nuevo usuario",
     description="Crea un nuevo usuario en el sistema con los datos proporcionados"
 )
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Registra un nuevo usuario en el sistema.
     
@@ -38,7 +38,7 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
         HTTPException 500: Error interno del servidor
     """
     try:
-        new_user = AuthService.register_user(db, user_data)
+        new_user = await AuthService.register_user(db, user_data)
         return new_user
     except ValueError as e:
         raise HTTPException(
@@ -58,7 +58,7 @@ def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
     summary="Iniciar sesión",
     description="Autentica al usuario y devuelve un token JWT"
 )
-def login_user(login_data: UserLogin, db: Session = Depends(get_db)):
+async def login_user(login_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """
     Inicia sesión y devuelve un token de acceso.
     
@@ -78,7 +78,7 @@ def login_user(login_data: UserLogin, db: Session = Depends(get_db)):
     ```
     """
     try:
-        token_data = AuthService.login(db, login_data.email, login_data.password)
+        token_data = await AuthService.login(db, login_data.email, login_data.password)
         return TokenResponse(**token_data)
     except ValueError as e:
         raise HTTPException(
@@ -1,71 +1,163 @@
 # src/app/routers/history.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Text, bindparam, cast, select
+from typing import Any, List
 from datetime import datetime
+import asyncio
+import hashlib
+import logging
+import re
+import orjson
 
-from app.database.database import get_db
+from app.database.database import AsyncSessionLocal
+from app.database.pg_pool import pg_fetch
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.audit_logs import AuditLog
-from pydantic import BaseModel
+from app.services.history_cache import get_cached_history, history_generation, set_cached_history
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from uuid import UUID
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/history", tags=["History"])
 
+# === CONFIGURACIÓN DE TIMEOUTS ===
+# Igual que statement_timeout del motor, pero cubre también la espera por una
+# conexión del pool y la red
+HISTORY_QUERY_TIMEOUT_SECONDS = 5
+
+# Solo las columnas que se devuelven: filas ligeras (Row), sin instancias ORM
+# ni relaciones perezosas que puedan disparar consultas por fila
+_HISTORY_COLUMNS = (
+    AuditLog.audit_log_id,
+    AuditLog.session_id,
+    AuditLog.sequence_chat_id,
+    AuditLog.question,
+    AuditLog.created_at,
+    AuditLog.document_type_id,
+    AuditLog.document_number,
+)
+# response_json como texto (jsonb::text): se inserta tal cual en la salida,
+# sin json.loads al leer ni volver a serializar el dict
+_SESSION_COLUMNS = _HISTORY_COLUMNS + (cast(AuditLog.response_json, Text).label("response_json"),)
+
+# GET /history/ es la consulta más frecuente: va directa por asyncpg (ver
+# pg_pool), que la prepara una vez por conexión. Mismas columnas que
+# _HISTORY_COLUMNS; el orden coincide con ix_audit_user_created
+_HISTORY_SQL = """
+    SELECT audit_log_id, session_id, sequence_chat_id, question,
+           created_at, document_type_id, document_number
+    FROM smart_health.audit_logs
+    WHERE user_id = $1
+    ORDER BY created_at DESC
+    LIMIT $2
+"""
+
+# Sentencia construida una vez con parámetros: por petición no se rearma el
+# select y SQLAlchemy reutiliza el SQL compilado
+_SESSION_STMT = (
+    select(*_SESSION_COLUMNS)
+    .where(
+        AuditLog.user_id == bindparam("uid"),
+        AuditLog.session_id == bindparam("sid")
+    )
+    .order_by(AuditLog.sequence_chat_id.asc())
+)
+
+# Validación del session_id sin construir un objeto UUID: el string se pasa
+# tal cual y PostgreSQL lo convierte a uuid
+# (\A...\Z y no ^...$: "$" también acepta un salto de línea final)
+_UUID_RE = re.compile(
+    r"\A[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z", re.IGNORECASE
+)
+
 
 class HistoryItemResponse(BaseModel):
     audit_log_id: int
-    session_id: str
+    session_id: UUID
     sequence_chat_id: int
     question: str
     created_at: datetime
     document_type_id: int
     document_number: str
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore", populate_by_name=True)
+
+
+class SessionHistoryItem(HistoryItemResponse):
+    # Se lee de AuditLog.response_json y se expone como "response"
+    response: Any = Field(validation_alias="response_json")
+
 
+# Validador/serializador de la lista completa, construido una vez: el núcleo
+# de Pydantic recorre todas las filas sin volver a Python por cada una
+HistoryListAdapter = TypeAdapter(List[HistoryItemResponse])
 
+
+def _history_response(request: Request, etag: str, body: bytes) -> Response:
+    """
+    Respuesta condicional: si el cliente ya tiene esta versión (If-None-Match)
+    se devuelve 304 sin cuerpo.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Las rutas devuelven Response/StreamingResponse ya serializados: los modelos
+# solo documentan el esquema (responses=), FastAPI no revalida la salida
 @router.get(
     "/",
-    response_model=List[HistoryItemResponse],
+    response_model=None,
+    responses={200: {"model": List[HistoryItemResponse]}},
     summary="Obtener historial de consultas del usuario"
 )
-def get_user_history(
-    limit: int = 50,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_user_history(
+    request: Request,
+    limit: int = Query(50, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
 ):
     """
     Obtiene el historial de consultas del usuario autenticado.
     Requiere token JWT válido.
+    
+    Devuelve ETag: con If-None-Match y sin consultas nuevas responde 304.
     """
+    # Caché del JSON ya serializado (se invalida al guardar nuevas consultas)
+    cached = get_cached_history(current_user.user_id, limit)
+    if cached is not None:
+        return _history_response(request, *cached)
+    generation = history_generation(current_user.user_id)
+    
     try:
-        history = (
-            db.query(AuditLog)
-            .filter(AuditLog.user_id == current_user.user_id)
-            .order_by(desc(AuditLog.created_at))
-            .limit(limit)
-            .all()
+        history = await asyncio.wait_for(
+            pg_fetch(_HISTORY_SQL, current_user.user_id, limit),
+            timeout=HISTORY_QUERY_TIMEOUT_SECONDS
         )
         
-        # Convertir session_id a string
-        result = []
-        for item in history:
-            result.append({
-                "audit_log_id": item.audit_log_id,
-                "session_id": str(item.session_id),
-                "sequence_chat_id": item.sequence_chat_id,
-                "question": item.question,
-                "created_at": item.created_at,
-                "document_type_id": item.document_type_id,
-                "document_number": item.document_number
-            })
+        # Validar la lista de una vez y serializar directamente a bytes JSON
+        # (los Record de asyncpg son mapeos: dict() da las claves por columna)
+        body = HistoryListAdapter.dump_json(
+            HistoryListAdapter.validate_python([dict(row) for row in history])
+        )
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        set_cached_history(current_user.user_id, limit, etag, body, generation)
         
-        return result
+        return _history_response(request, etag, body)
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout obteniendo historial después de {HISTORY_QUERY_TIMEOUT_SECONDS}s")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="La consulta del historial excedió el tiempo máximo"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -73,61 +165,86 @@ def get_user_history(
         )
 
 
+def _session_row_json(row) -> bytes:
+    item = HistoryItemResponse.model_validate(row).model_dump()
+    # El texto ya es JSON válido: orjson.Fragment lo copia sin parsearlo
+    item["response"] = orjson.Fragment(row.response_json)
+    return orjson.dumps(item)
+
+
 @router.get(
     "/session/{session_id}",
+    response_model=None,
+    responses={200: {"model": List[SessionHistoryItem]}},
     summary="Obtener consultas de una sesión específica"
 )
-def get_session_history(
+async def get_session_history(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """
     Obtiene todas las consultas de una sesión específica con sus respuestas.
     Solo retorna sesiones del usuario autenticado.
+    
+    La respuesta se envía por partes (una fila cada vez) desde un cursor del
+    servidor: memoria constante aunque la sesión tenga muchos response_json.
     """
-    try:
-        session_uuid = UUID(session_id)
-        
-        history = (
-            db.query(AuditLog)
-            .filter(
-                AuditLog.user_id == current_user.user_id,
-                AuditLog.session_id == session_uuid
-            )
-            .order_by(AuditLog.sequence_chat_id.asc())
-            .all()
-        )
-        
-        if not history:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Sesión no encontrada o no tienes acceso a ella"
-            )
-        
-        # Retornar con respuestas
-        result = []
-        for item in history:
-            result.append({
-                "audit_log_id": item.audit_log_id,
-                "session_id": str(item.session_id),
-                "sequence_chat_id": item.sequence_chat_id,
-                "question": item.question,
-                "response": item.response_json,
-                "created_at": item.created_at.isoformat(),
-                "document_type_id": item.document_type_id,
-                "document_number": item.document_number
-            })
-        
-        return result
-    except ValueError:
+    if not _UUID_RE.match(session_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="session_id inválido"
         )
+    
+    # Sesión propia y no Depends(get_async_db): las dependencias con yield
+    # se cierran antes de que termine de enviarse un StreamingResponse
+    db = AsyncSessionLocal()
+    
+    async def open_stream():
+        result = await db.stream(
+            _SESSION_STMT, {"uid": current_user.user_id, "sid": session_id}
+        )
+        rows = aiter(result)
+        # La primera fila decide el 404 antes de empezar a responder
+        return result, rows, await anext(rows, None)
+    
+    try:
+        result, rows, first = await asyncio.wait_for(
+            open_stream(), timeout=HISTORY_QUERY_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        await db.close()
+        logger.error(f"Timeout obteniendo historial de sesión después de {HISTORY_QUERY_TIMEOUT_SECONDS}s")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="La consulta del historial excedió el tiempo máximo"
+        )
     except Exception as e:
+        await db.close()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error obteniendo historial de sesión: {str(e)}"
         )
-
+    
+    if first is None:
+        await result.close()
+        await db.close()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sesión no encontrada o no tienes acceso a ella"
+        )
+    
+    async def body():
+        try:
+            yield b"[" + _session_row_json(first)
+            async for row in rows:
+                yield b"," + _session_row_json(row)
+            yield b"]"
+        except Exception as e:
+            # El status ya se envió: solo queda registrar y cortar la respuesta
+            logger.error(f"Error enviando historial de sesión: {type(e).__name__}: {e}")
+            raise
+        finally:
+            await result.close()
+            await db.close()
+    
+    return StreamingResponse(body(), media_type="application/json")
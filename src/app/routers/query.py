@@ -1,19 +1,24 @@
 # src/app/routers/query.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple
+from datetime import date
+from uuid import UUID
 import logging
 import time
+from operator import attrgetter
 import asyncio
 import re
+import string
+from types import MappingProxyType
 
 from app.services.llm_service import llm_service
 from app.services.clinical_service import fetch_patient_and_records
-from app.services.vector_search import search_similar_chunks
-from app.database.database import get_db
-from app.schemas.clinical import PatientInfo, ClinicalRecords
+from app.services.vector_search import embed_question, query_vector_index
+from app.services.rag_cache import rag_cache_key, get_cached_answer, set_cached_answer
+from app.services.audit_writer import audit_writer
+from app.database.database import SessionLocal
+from app.schemas.clinical import PatientInfo, ClinicalRecords, ClinicalDataResult
 
 router = APIRouter(prefix="/query", tags=["RAG Query"])
 logger = logging.getLogger(__name__)
@@ -23,6 +28,92 @@ LLM_TIMEOUT_SECONDS = 30
 VECTOR_SEARCH_TIMEOUT_SECONDS = 10
 TOTAL_REQUEST_TIMEOUT_SECONDS = 45
 
+# === VALIDACIÓN (compilada una vez al importar) ===
+VALID_DOC_TYPES = frozenset({1, 2, 3, 4, 5, 6, 7, 8})
+
+# ID de tipo de documento -> sigla (solo lectura, se construye una vez)
+DOCUMENT_TYPE_NAMES = MappingProxyType({
+    1: "CC", 2: "CE", 3: "TI", 4: "PA",
+    5: "RC", 6: "MS", 7: "AS", 8: "CD",
+})
+
+# Lectores de campos de los DTO clínicos (schemas/clinical.py, schemas/rag.py):
+# todos los campos existen siempre en el modelo, así que un attrgetter
+# multi-campo (una llamada en C) reemplaza a varios getattr con default
+_PATIENT_FIELDS = attrgetter(
+    'first_name', 'first_surname', 'document_number', 'gender', 'email'
+)
+_PATIENT_RESPONSE_FIELDS = attrgetter(
+    'patient_id', 'first_name', 'first_surname', 'second_surname', 'document_number'
+)
+_APT_CONTEXT_FIELDS = attrgetter(
+    'appointment_date', 'status', 'reason', 'appointment_type',
+    'doctor_name', 'specialty_name'
+)
+_RECORD_CONTEXT_FIELDS = attrgetter('summary_text', 'registration_datetime', 'record_type')
+_PRESC_CONTEXT_FIELDS = attrgetter(
+    'medication_name', 'dosage', 'frequency', 'duration', 'instruction',
+    'prescription_date'
+)
+_DIAG_CONTEXT_FIELDS = attrgetter(
+    'description', 'icd_code', 'diagnosis_type', 'note', 'diagnosis_date'
+)
+_CHUNK_CONTEXT_FIELDS = attrgetter('chunk_text', 'relevance_score', 'source_type', 'date')
+
+_APT_SOURCE_FIELDS = attrgetter(
+    'appointment_id', 'appointment_date', 'reason', 'doctor_name',
+    'specialty_name', 'medical_license_number'
+)
+_DIAG_SOURCE_FIELDS = attrgetter('diagnosis_id', 'description', 'icd_code', 'diagnosis_date')
+_PRESC_SOURCE_FIELDS = attrgetter(
+    'prescription_id', 'medication_name', 'prescription_date', 'dosage', 'frequency'
+)
+_CHUNK_SOURCE_FIELDS = attrgetter('source_id', 'source_type', 'relevance_score', 'date')
+
+# Solo letras, números y guiones en el número de documento: tabla para
+# str.translate (búsqueda por carácter en C, sin motor de regex). Los ASCII
+# permitidos se mapean a sí mismos; todo lo demás, incluido lo no ASCII, se borra
+_DOC_NUMBER_KEEP = frozenset(string.ascii_letters + string.digits + "-")
+
+
+class _DocNumberTable(dict):
+    def __missing__(self, codepoint):
+        return None
+
+
+_DOC_NUMBER_TABLE = _DocNumberTable(
+    {c: (c if chr(c) in _DOC_NUMBER_KEEP else None) for c in range(128)}
+)
+
+# Patrones básicos de inyección SQL, unidos en una sola alternancia:
+# una pasada sobre el texto en lugar de una por patrón.
+# Los patrones "X ... Y" se anclan al inicio de línea y solo prueban desde la
+# primera X de cada línea: con "X.*Y" suelto, re reintenta desde cada X y
+# vuelve a recorrer el resto de la línea (cuadrático con ";;;;..." o
+# "UNION UNION ..."). Detectan exactamente los mismos textos.
+_DANGEROUS_PATTERNS = (
+    r"(?m:^)(?:(?!\bOR\b).)*\bOR\b.*=",
+    r"(?m:^)(?:(?!\bAND\b).)*\bAND\b.*=",
+    r"DROP\s+TABLE",
+    r"DELETE\s+FROM",
+    r"INSERT\s+INTO",
+    r"UPDATE\s+\w+\s+SET",
+    r"--\s*$",
+    r"(?m:^)[^;\n]*;.*SELECT",
+    r"(?m:^)(?:(?!\bUNION\b).)*\bUNION\b.*\bSELECT\b",
+)
+_SQL_INJECTION_RE = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in _DANGEROUS_PATTERNS),
+    re.IGNORECASE
+)
+# Filtro previo: cada patrón exige uno de estos literales. Sin ".*" no hay
+# retroceso, y en una pregunta normal no aparece ninguno, así que el regex
+# completo solo corre cuando hay algo sospechoso
+_SQL_KEYWORD_RE = re.compile(
+    r"\bOR\b|\bAND\b|DROP|DELETE|INSERT|UPDATE|UNION|--|;",
+    re.IGNORECASE
+)
+
 # === SCHEMAS ===
 
 class QueryInput(BaseModel):
@@ -40,75 +131,91 @@ def sanitize_document_number(doc_number: str) -> str:
     Sanitiza el número de documento eliminando caracteres peligrosos.
      FIX JAILBREAK: Solo permite letras, números y guiones
     """
-    # Eliminar espacios
-    doc_number = doc_number.strip()
-    
-    # Solo permitir: letras (A-Z, a-z), números (0-9), guiones (-), sin espacios
-    sanitized = re.sub(r'[^A-Za-z0-9\-]', '', doc_number)
-    
-    # Limitar longitud máxima
-    if len(sanitized) > 50:
-        sanitized = sanitized[:50]
-    
-    return sanitized
+    # Eliminar espacios, dejar solo letras (A-Z, a-z), números (0-9) y guiones,
+    # y limitar la longitud máxima a 50
+    return doc_number.strip().translate(_DOC_NUMBER_TABLE)[:50]
+
+
+def _find_sql_injection(text: str) -> Optional[re.Match]:
+    """Primer patrón peligroso en el texto, o None (el filtro previo descarta casi todo)"""
+    return _SQL_KEYWORD_RE.search(text) and _SQL_INJECTION_RE.search(text) or None
 
 
-def validate_query_input(input_data: QueryInput) -> tuple[bool, Optional[str]]:
+def validate_query_input(input_data: QueryInput) -> tuple[bool, Optional[str], Optional[str]]:
     """
     Valida los datos de entrada para prevenir inyecciones.
      FIX JAILBREAK: Validación estricta
     
     Returns:
-        (is_valid, error_message)
+        (is_valid, error_message, sanitized_document_number); el documento
+        sanitizado es None si la validación falla
     """
+    # Orden de menor a mayor costo: comparaciones de enteros y longitudes
+    # primero; la sanitización y el regex solo si todo lo anterior pasa
+    
     # Validar document_type_id
-    valid_doc_types = [1, 2, 3, 4, 5, 6, 7, 8]
-    if input_data.document_type_id not in valid_doc_types:
-        return False, f"Tipo de documento inválido: {input_data.document_type_id}"
+    if input_data.document_type_id not in VALID_DOC_TYPES:
+        return False, f"Tipo de documento inválido: {input_data.document_type_id}", None
     
     # Validar document_number
-    if not input_data.document_number or len(input_data.document_number.strip()) == 0:
-        return False, "Número de documento vacío"
+    if not input_data.document_number or not input_data.document_number.strip():
+        return False, "Número de documento vacío", None
+    
+    # Validar pregunta
+    if len(input_data.question) > 1000:
+        return False, "La pregunta no puede exceder 1000 caracteres", None
+    
+    if not input_data.question or len(input_data.question.strip()) < 5:
+        return False, "La pregunta debe tener al menos 5 caracteres", None
     
     sanitized_doc = sanitize_document_number(input_data.document_number)
     if not sanitized_doc:
-        return False, "Número de documento contiene caracteres inválidos"
+        return False, "Número de documento contiene caracteres inválidos", None
     
     if len(sanitized_doc) < 3:
-        return False, "Número de documento muy corto (mínimo 3 caracteres)"
+        return False, "Número de documento muy corto (mínimo 3 caracteres)", None
     
-    # Validar pregunta
-    if not input_data.question or len(input_data.question.strip()) < 5:
-        return False, "La pregunta debe tener al menos 5 caracteres"
+    # Detectar intentos de inyección SQL básicos: cada campo por separado,
+    # sin construir una cadena combinada
+    match = _find_sql_injection(input_data.question) or _find_sql_injection(input_data.document_number)
+    if match:
+        logger.warning(f" Posible intento de inyección SQL detectado: {match.group(0)[:50]!r}")
+        return False, "Query contiene patrones potencialmente peligrosos", None
     
-    if len(input_data.question) > 1000:
-        return False, "La pregunta no puede exceder 1000 caracteres"
-    
-    # Detectar intentos de inyección SQL básicos
-    dangerous_patterns = [
-        r"(\bOR\b.*=.*)",
-        r"(\bAND\b.*=.*)",
-        r"(DROP\s+TABLE)",
-        r"(DELETE\s+FROM)",
-        r"(INSERT\s+INTO)",
-        r"(UPDATE\s+\w+\s+SET)",
-        r"(--\s*$)",
-        r"(;.*SELECT)",
-        r"(\bUNION\b.*\bSELECT\b)",
-    ]
-    
-    combined_input = f"{input_data.document_number} {input_data.question}"
-    for pattern in dangerous_patterns:
-        if re.search(pattern, combined_input, re.IGNORECASE):
-            logger.warning(f" Posible intento de inyección SQL detectado: {pattern}")
-            return False, "Query contiene patrones potencialmente peligrosos"
-    
-    return True, None
+    return True, None, sanitized_doc
+
+
+def _err(
+    session_id: str,
+    sequence_chat_id: int,
+    timestamp: str,
+    code: str,
+    message: str,
+    details: str
+) -> dict:
+    """Respuesta de error con el formato común de /query"""
+    return {
+        "status": "error",
+        "session_id": session_id,
+        "sequence_chat_id": sequence_chat_id,
+        "timestamp": timestamp,
+        "error": {
+            "code": code,
+            "message": message,
+            "details": details
+        }
+    }
 
 
 def get_iso_timestamp() -> str:
     """Retorna timestamp en formato ISO 8601 con Z (UTC)"""
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    # Formateo directo de struct_time: evita datetime.now() y el parseo del
+    # formato de strftime en cada llamada
+    t = time.gmtime()
+    return (
+        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+        f"T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}Z"
+    )
 
 
 def build_context_from_real_data(
@@ -117,8 +224,6 @@ def build_context_from_real_data(
     similar_chunks: List
 ) -> str:
     """Construye el contexto clínico de manera segura"""
-    
-    from datetime import date, datetime
 
     # === Calcular edad ===
     age = "No disponible"
@@ -127,7 +232,7 @@ def build_context_from_real_data(
             birth_date = (
                 patient_info.birth_date
                 if isinstance(patient_info.birth_date, date)
-                else datetime.strptime(patient_info.birth_date, "%Y-%m-%d").date()
+                else date.fromisoformat(patient_info.birth_date)
             )
             today = date.today()
             age = today.year - birth_date.year - (
@@ -137,14 +242,12 @@ def build_context_from_real_data(
             logger.warning(f"Error calculando edad: {e}")
             age = "No disponible"
 
-    # Usar getattr para todos los campos de patient_info
-    first_name = getattr(patient_info, 'first_name', 'Nombre')
-    first_surname = getattr(patient_info, 'first_surname', 'Apellido')
-    document_number = getattr(patient_info, 'document_number', 'No disponible')
-    gender = getattr(patient_info, 'gender', None) or "No registrado"
-    email = getattr(patient_info, 'email', None) or "No registrado"
+    first_name, first_surname, document_number, gender, email = _PATIENT_FIELDS(patient_info)
+    gender = gender or "No registrado"
+    email = email or "No registrado"
 
-    context = f"""
+    # Las partes se acumulan en una lista y se unen una sola vez al final
+    parts = [f"""
 ### INFORMACIÓN BÁSICA DEL PACIENTE
 Nombre: {first_name} {first_surname}
 Edad: {age}
@@ -152,46 +255,37 @@ Documento: {document_number}
 Género: {gender}
 Email: {email}
 
-"""
+"""]
 
     # === CITAS ===
     if clinical_records.appointments:
-        context += "### CITAS MÉDICAS RECIENTES\n"
+        parts.append("### CITAS MÉDICAS RECIENTES\n")
         for apt in clinical_records.appointments[:10]:
-            apt_date = getattr(apt, 'appointment_date', 'Fecha no disponible')
-            apt_status = getattr(apt, 'status', None) or 'No disponible'
-            apt_reason = getattr(apt, 'reason', None) or 'No especificado'
-            apt_type = getattr(apt, 'appointment_type', None) or 'Consulta'
-            doctor_name = getattr(apt, 'doctor_name', None)
-            specialty = getattr(apt, 'specialty_name', None)
+            (apt_date, apt_status, apt_reason, apt_type,
+             doctor_name, specialty) = _APT_CONTEXT_FIELDS(apt)
+            apt_status = apt_status or 'No disponible'
+            apt_reason = apt_reason or 'No especificado'
+            apt_type = apt_type or 'Consulta'
             
-            context += f"**Cita {apt_date}**\n"
-            context += f"- Tipo: {apt_type}\n"
-            context += f"- Estado: {apt_status}\n"
-            context += f"- Motivo: {apt_reason}\n"
+            parts.append(f"**Cita {apt_date}**\n")
+            parts.append(f"- Tipo: {apt_type}\n")
+            parts.append(f"- Estado: {apt_status}\n")
+            parts.append(f"- Motivo: {apt_reason}\n")
             if doctor_name:
-                context += f"- Doctor: {doctor_name}"
+                parts.append(f"- Doctor: {doctor_name}")
                 if specialty:
-                    context += f" ({specialty})"
-                context += "\n"
-            context += "\n"
+                    parts.append(f" ({specialty})")
+                parts.append("\n")
+            parts.append("\n")
 
     # === REGISTROS MÉDICOS ===
     if clinical_records.medical_records:
-        context += "### REGISTROS MÉDICOS\n"
+        parts.append("### REGISTROS MÉDICOS\n")
         for rec in clinical_records.medical_records[:10]:
-            desc = (
-                getattr(rec, "summary_text", None) or
-                getattr(rec, "description", None) or
-                getattr(rec, "details", None) or
-                getattr(rec, "notes", None) or
-                "Sin descripción"
-            )
-            
-            rec_date = getattr(rec, 'registration_datetime', 'Fecha no disponible')
-            rec_type = getattr(rec, 'record_type', 'Tipo no especificado')
+            desc, rec_date, rec_type = _RECORD_CONTEXT_FIELDS(rec)
+            desc = desc or "Sin descripción"
 
-            context += (
+            parts.append(
                 f"- Fecha: {rec_date}\n"
                 f"  Tipo: {rec_type}\n"
                 f"  Descripción: {desc}\n\n"
@@ -199,58 +293,140 @@ Email: {email}
 
     # === PRESCRIPCIONES ===
     if clinical_records.prescriptions:
-        context += "### MEDICAMENTOS Y PRESCRIPCIONES\n"
+        parts.append("### MEDICAMENTOS Y PRESCRIPCIONES\n")
         for presc in clinical_records.prescriptions[:15]:
-            medication = getattr(presc, 'medication_name', 'Medicamento sin nombre')
-            dosage = getattr(presc, 'dosage', '')
-            frequency = getattr(presc, 'frequency', '')
-            duration = getattr(presc, 'duration', None)
-            instruction = getattr(presc, 'instruction', None)
-            presc_date = getattr(presc, 'prescription_date', None)
+            (medication, dosage, frequency, duration,
+             instruction, presc_date) = _PRESC_CONTEXT_FIELDS(presc)
             
-            context += f"**{medication}**\n"
+            parts.append(f"**{medication}**\n")
             if dosage or frequency:
-                context += f"- Dosis: {dosage} {frequency}\n"
+                parts.append(f"- Dosis: {dosage} {frequency}\n")
             if duration:
-                context += f"- Duración: {duration}\n"
+                parts.append(f"- Duración: {duration}\n")
             if instruction:
-                context += f"- Indicaciones: {instruction}\n"
+                parts.append(f"- Indicaciones: {instruction}\n")
             if presc_date:
-                context += f"- Fecha de prescripción: {presc_date}\n"
-            context += "\n"
+                parts.append(f"- Fecha de prescripción: {presc_date}\n")
+            parts.append("\n")
 
     # === DIAGNÓSTICOS ===
     if clinical_records.diagnoses:
-        context += "### DIAGNÓSTICOS\n"
+        parts.append("### DIAGNÓSTICOS\n")
         for diag in clinical_records.diagnoses[:15]:
-            diag_desc = getattr(diag, 'description', 'Diagnóstico sin descripción')
-            icd_code = getattr(diag, 'icd_code', 'Sin código')
-            diag_type = getattr(diag, 'diagnosis_type', 'Tipo no especificado')
-            note = getattr(diag, 'note', None)
-            diag_date = getattr(diag, 'diagnosis_date', None)
+            diag_desc, icd_code, diag_type, note, diag_date = _DIAG_CONTEXT_FIELDS(diag)
             
-            context += f"**{diag_desc}**\n"
-            context += f"- Código ICD-10: {icd_code}\n"
-            context += f"- Tipo: {diag_type}\n"
+            parts.append(f"**{diag_desc}**\n")
+            parts.append(f"- Código ICD-10: {icd_code}\n")
+            parts.append(f"- Tipo: {diag_type}\n")
             if diag_date:
-                context += f"- Fecha: {diag_date}\n"
+                parts.append(f"- Fecha: {diag_date}\n")
             if note:
-                context += f"- Nota: {note}\n"
-            context += "\n"
+                parts.append(f"- Nota: {note}\n")
+            parts.append("\n")
 
     # === VECTOR SEARCH ===
     if similar_chunks:
-        context += "### INFORMACIÓN ADICIONAL RELEVANTE (BÚSQUEDA SEMÁNTICA)\n"
+        parts.append("### INFORMACIÓN ADICIONAL RELEVANTE (BÚSQUEDA SEMÁNTICA)\n")
         for chunk in similar_chunks[:5]:
-            chunk_text = getattr(chunk, 'chunk_text', 'Texto no disponible')
-            relevance = getattr(chunk, 'relevance_score', 0.0)
-            source_type = getattr(chunk, 'source_type', 'Desconocida')
-            chunk_date = getattr(chunk, 'date', 'Sin fecha')
+            chunk_text, relevance, source_type, chunk_date = _CHUNK_CONTEXT_FIELDS(chunk)
             
-            context += f"- [Relevancia: {relevance:.2f}] {chunk_text}\n"
-            context += f"  Fuente: {source_type} - Fecha: {chunk_date}\n\n"
+            parts.append(f"- [Relevancia: {relevance:.2f}] {chunk_text}\n")
+            parts.append(f"  Fuente: {source_type} - Fecha: {chunk_date}\n\n")
+
+    return "".join(parts)
+
+
+# Constructores de una fuente por registro. Devuelven None si el registro no
+# tiene id; "source_id" va primero (orden de claves del JSON) y se numera al final
+
+def _appointment_source(apt) -> Optional[Dict]:
+    (apt_id, apt_date, apt_reason, doctor_name,
+     specialty_name, medical_license) = _APT_SOURCE_FIELDS(apt)
+    if not apt_id:
+        return None
+    
+    source = {
+        "source_id": None,
+        "type": "appointment",
+        "appointment_id": int(apt_id),
+        "date": str(apt_date) if apt_date else None,
+        "relevance_score": 0.98
+    }
+    
+    if doctor_name or specialty_name:
+        doctor_info = {}
+        if doctor_name:
+            doctor_info["name"] = doctor_name
+        if specialty_name:
+            doctor_info["specialty"] = specialty_name
+        if medical_license:
+            doctor_info["medical_license"] = medical_license
+        
+        if doctor_info:
+            source["doctor"] = doctor_info
+    
+    if apt_reason:
+        source["reason"] = apt_reason
+    
+    return source
+
+
+def _diagnosis_source(diag) -> Optional[Dict]:
+    diag_id, diag_desc, icd_code, diag_date = _DIAG_SOURCE_FIELDS(diag)
+    if not diag_id:
+        return None
+    
+    source = {
+        "source_id": None,
+        "type": "diagnosis",
+        "diagnosis_id": int(diag_id),
+        "description": diag_desc,
+        "relevance_score": 0.95
+    }
+    
+    if icd_code:
+        source["icd_code"] = icd_code
+    if diag_date:
+        source["date"] = str(diag_date.date()) if hasattr(diag_date, 'date') else str(diag_date)
+    
+    return source
+
+
+def _prescription_source(presc) -> Optional[Dict]:
+    presc_id, medication, presc_date, dosage, frequency = _PRESC_SOURCE_FIELDS(presc)
+    if not presc_id:
+        return None
+    
+    source = {
+        "source_id": None,
+        "type": "prescription",
+        "prescription_id": int(presc_id),
+        "medication": medication,
+        "date": str(presc_date) if presc_date else None,
+        "relevance_score": 0.92
+    }
+    
+    if dosage:
+        source["dosage"] = dosage
+    if frequency:
+        source["frequency"] = frequency
+    
+    return source
 
-    return context
+
+def _chunk_source(chunk) -> Optional[Dict]:
+    source_id, source_type, relevance, chunk_date = _CHUNK_SOURCE_FIELDS(chunk)
+    if not source_id:
+        return None
+    
+    return {
+        "source_id": None,
+        "type": "vector_search",
+        "original_source_id": str(source_id),
+        "source_type": source_type,
+        "relevance_score": float(relevance),
+        "date": str(chunk_date) if chunk_date else None
+    }
 
 
 def build_sources_from_real_data(
@@ -259,149 +435,32 @@ def build_sources_from_real_data(
     sequence_counter: int
 ) -> List[Dict]:
     """Construye lista de fuentes siguiendo el formato EXACTO de la especificación"""
-    sources = []
-    current_sequence = sequence_counter
+    sections = (
+        ("appointments", _appointment_source, clinical_records.appointments[:5]),
+        ("diagnoses", _diagnosis_source, clinical_records.diagnoses[:5]),
+        ("prescriptions", _prescription_source, clinical_records.prescriptions[:3]),
+        ("vector chunks", _chunk_source, similar_chunks[:5]),
+    )
+    
+    # Una comprensión por sección; si una sección falla, queda vacía y
+    # las demás se conservan
+    sources: List[Dict] = []
+    for section_name, build_source, items in sections:
+        try:
+            sources += [source for source in map(build_source, items) if source is not None]
+        except Exception as e:
+            logger.warning(f"Error construyendo sources de {section_name}: {e}")
+    
+    # Numeración correlativa en una sola pasada
+    for source_id, source in enumerate(sources, start=sequence_counter):
+        source["source_id"] = source_id
     
-    # CITAS
-    try:
-        for apt in clinical_records.appointments[:5]:
-            apt_id = getattr(apt, 'appointment_id', None)
-            if not apt_id:
-                continue
-                
-            apt_date = getattr(apt, 'appointment_date', None)
-            apt_reason = getattr(apt, 'reason', None)
-            doctor_name = getattr(apt, 'doctor_name', None)
-            specialty_name = getattr(apt, 'specialty_name', None)
-            medical_license = getattr(apt, 'medical_license_number', None)
-            
-            source = {
-                "source_id": current_sequence,
-                "type": "appointment",
-                "appointment_id": int(apt_id),
-                "date": str(apt_date) if apt_date else None,
-                "relevance_score": 0.98
-            }
-            
-            if doctor_name or specialty_name:
-                doctor_info = {}
-                if doctor_name:
-                    doctor_info["name"] = doctor_name
-                if specialty_name:
-                    doctor_info["specialty"] = specialty_name
-                if medical_license:
-                    doctor_info["medical_license"] = medical_license
-                
-                if doctor_info:
-                    source["doctor"] = doctor_info
-            
-            if apt_reason:
-                source["reason"] = apt_reason
-                
-            sources.append(source)
-            current_sequence += 1
-            
-    except Exception as e:
-        logger.warning(f"Error construyendo sources de appointments: {e}")
-
-    # DIAGNÓSTICOS
-    try:
-        for diag in clinical_records.diagnoses[:5]:
-            diag_id = getattr(diag, 'diagnosis_id', None)
-            if not diag_id:
-                continue
-                
-            diag_desc = getattr(diag, 'description', 'Sin descripción')
-            icd_code = getattr(diag, 'icd_code', None)
-            diag_date = getattr(diag, 'diagnosis_date', None)
-            
-            source = {
-                "source_id": current_sequence,
-                "type": "diagnosis",
-                "diagnosis_id": int(diag_id),
-                "description": diag_desc,
-                "relevance_score": 0.95
-            }
-            
-            if icd_code:
-                source["icd_code"] = icd_code
-            if diag_date:
-                source["date"] = str(diag_date.date()) if hasattr(diag_date, 'date') else str(diag_date)
-                
-            sources.append(source)
-            current_sequence += 1
-            
-    except Exception as e:
-        logger.warning(f"Error construyendo sources de diagnoses: {e}")
-
-    # PRESCRIPCIONES
-    try:
-        for presc in clinical_records.prescriptions[:3]:
-            presc_id = getattr(presc, 'prescription_id', None)
-            if not presc_id:
-                continue
-                
-            medication = getattr(presc, 'medication_name', 'Medicamento no especificado')
-            presc_date = getattr(presc, 'prescription_date', None)
-            dosage = getattr(presc, 'dosage', None)
-            frequency = getattr(presc, 'frequency', None)
-            
-            source = {
-                "source_id": current_sequence,
-                "type": "prescription",
-                "prescription_id": int(presc_id),
-                "medication": medication,
-                "date": str(presc_date) if presc_date else None,
-                "relevance_score": 0.92
-            }
-            
-            if dosage:
-                source["dosage"] = dosage
-            if frequency:
-                source["frequency"] = frequency
-            
-            sources.append(source)
-            current_sequence += 1
-            
-    except Exception as e:
-        logger.warning(f"Error construyendo sources de prescriptions: {e}")
-
-    # VECTOR CHUNKS
-    try:
-        for chunk in similar_chunks[:5]:
-            source_id = getattr(chunk, 'source_id', None)
-            if not source_id:
-                continue
-                
-            source_type = getattr(chunk, 'source_type', 'unknown')
-            relevance = getattr(chunk, 'relevance_score', 0.0)
-            chunk_date = getattr(chunk, 'date', None)
-            
-            source = {
-                "source_id": current_sequence,
-                "type": "vector_search",
-                "original_source_id": str(source_id),
-                "source_type": source_type,
-                "relevance_score": float(relevance),
-                "date": str(chunk_date) if chunk_date else None
-            }
-            
-            sources.append(source)
-            current_sequence += 1
-            
-    except Exception as e:
-        logger.warning(f"Error construyendo sources de vector chunks: {e}")
-
     return sources
 
 
 def get_document_type_name(document_type_id: int) -> str:
     """Mapea ID de tipo de documento a nombre"""
-    types = {
-        1: "CC", 2: "CE", 3: "TI", 4: "PA",
-        5: "RC", 6: "MS", 7: "AS", 8: "CD",
-    }
-    return types.get(document_type_id, "CC")
+    return DOCUMENT_TYPE_NAMES.get(document_type_id, "CC")
 
 
 def _generate_fallback_response(clinical_records: ClinicalRecords, question: str) -> str:
@@ -441,7 +500,7 @@ def _generate_fallback_response(clinical_records: ClinicalRecords, question: str
 # === ENDPOINT PRINCIPAL ===
 
 @router.post("/")
-async def query_patient(input_data: QueryInput, db: Session = Depends(get_db)):
+async def query_patient(input_data: QueryInput):
     """
     Endpoint principal de consulta RAG con validación de seguridad.
      FIX JAILBREAK: Validación estricta de inputs
@@ -451,44 +510,33 @@ async def query_patient(input_data: QueryInput, db: Session = Depends(get_db)):
     sequence_chat_id = 1
 
     #  VALIDACIÓN DE SEGURIDAD
-    is_valid, error_msg = validate_query_input(input_data)
+    is_valid, error_msg, sanitized_doc_number = validate_query_input(input_data)
     if not is_valid:
         logger.warning(f" Input inválido rechazado: {error_msg}")
-        return {
-            "status": "error",
-            "session_id": input_data.session_id,
-            "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "error": {
-                "code": "INVALID_INPUT",
-                "message": error_msg,
-                "details": "Verifica que los datos sean correctos"
-            }
-        }
+        return _err(
+            input_data.session_id, sequence_chat_id, timestamp,
+            "INVALID_INPUT",
+            error_msg,
+            "Verifica que los datos sean correctos"
+        )
     
-    #  SANITIZAR NÚMERO DE DOCUMENTO
-    sanitized_doc_number = sanitize_document_number(input_data.document_number)
+    #  NÚMERO DE DOCUMENTO YA SANITIZADO (por validate_query_input)
     logger.info(f" Query para paciente: {input_data.document_type_id}-{sanitized_doc_number}")
 
     try:
         return await asyncio.wait_for(
-            _process_query(input_data, db, start_time, timestamp, sequence_chat_id, sanitized_doc_number),
+            _process_query(input_data, start_time, timestamp, sequence_chat_id, sanitized_doc_number),
             timeout=TOTAL_REQUEST_TIMEOUT_SECONDS
         )
     
     except asyncio.TimeoutError:
         logger.error(f"Request timeout después de {TOTAL_REQUEST_TIMEOUT_SECONDS}s")
-        return {
-            "status": "error",
-            "session_id": input_data.session_id,
-            "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "error": {
-                "code": "REQUEST_TIMEOUT",
-                "message": f"La solicitud excedió el tiempo máximo de {TOTAL_REQUEST_TIMEOUT_SECONDS} segundos",
-                "details": "Intente nuevamente con una pregunta más específica"
-            }
-        }
+        return _err(
+            input_data.session_id, sequence_chat_id, timestamp,
+            "REQUEST_TIMEOUT",
+            f"La solicitud excedió el tiempo máximo de {TOTAL_REQUEST_TIMEOUT_SECONDS} segundos",
+            "Intente nuevamente con una pregunta más específica"
+        )
     
     except asyncio.CancelledError:
         logger.warning("Request cancelado por el cliente")
@@ -496,22 +544,16 @@ async def query_patient(input_data: QueryInput, db: Session = Depends(get_db)):
     
     except Exception as e:
         logger.exception("Error inesperado en endpoint")
-        return {
-            "status": "error",
-            "session_id": input_data.session_id,
-            "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "error": {
-                "code": "INTERNAL_ERROR",
-                "message": "Error interno del servidor",
-                "details": str(e)
-            }
-        }
+        return _err(
+            input_data.session_id, sequence_chat_id, timestamp,
+            "INTERNAL_ERROR",
+            "Error interno del servidor",
+            str(e)
+        )
 
 
 async def _process_query(
     input_data: QueryInput,
-    db: Session,
     start_time: float,
     timestamp: str,
     sequence_chat_id: int,
@@ -521,57 +563,73 @@ async def _process_query(
     
     logger.info(f"Procesando query - Session: {input_data.session_id}")
 
+    # 0. RESPUESTA CACHEADA (mismo paciente y misma pregunta)
+    cache_key = rag_cache_key(input_data.document_type_id, sanitized_doc_number, input_data.question)
+    cached = get_cached_answer(cache_key)
+    if cached is not None:
+        logger.info("Respuesta servida desde caché RAG")
+        response = {
+            **cached,
+            "session_id": input_data.session_id,
+            "sequence_chat_id": sequence_chat_id,
+            "timestamp": timestamp,
+            "metadata": {
+                **cached["metadata"],
+                "query_time_ms": int((time.time() - start_time) * 1000)
+            }
+        }
+        await _save_audit_log(input_data, sequence_chat_id, sanitized_doc_number, response)
+        return response
+
+    # El embedding de la pregunta no depende del paciente: se calcula en
+    # paralelo con la búsqueda en BD en lugar de después
+    embed_task = asyncio.create_task(_embed_question_or_none(input_data.question))
+
     # 1. BUSCAR PACIENTE (usando documento sanitizado)
     try:
-        patient_info, clinical_data = fetch_patient_and_records(
-            db=db,
-            document_type_id=input_data.document_type_id,
-            document_number=sanitized_doc_number  #  Sanitizado
+        patient_info, clinical_data = await asyncio.to_thread(
+            _fetch_patient,
+            input_data.document_type_id,
+            sanitized_doc_number  #  Sanitizado
         )
     except Exception as e:
+        embed_task.cancel()
         logger.error(f"Error en búsqueda de paciente: {type(e).__name__}")
-        return {
-            "status": "error",
-            "session_id": input_data.session_id,
-            "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "error": {
-                "code": "DATABASE_ERROR",
-                "message": "Error al buscar datos del paciente",
-                "details": str(e)
-            }
-        }
+        return _err(
+            input_data.session_id, sequence_chat_id, timestamp,
+            "DATABASE_ERROR",
+            "Error al buscar datos del paciente",
+            str(e)
+        )
 
     if not patient_info:
+        embed_task.cancel()
         doc_type = get_document_type_name(input_data.document_type_id)
-        return {
-            "status": "error",
-            "session_id": input_data.session_id,
-            "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "error": {
-                "code": "PATIENT_NOT_FOUND",
-                "message": f"No se encontró paciente con documento {doc_type} {sanitized_doc_number}",
-                "details": "Verifique el tipo y número de documento"
-            }
-        }
+        return _err(
+            input_data.session_id, sequence_chat_id, timestamp,
+            "PATIENT_NOT_FOUND",
+            f"No se encontró paciente con documento {doc_type} {sanitized_doc_number}",
+            "Verifique el tipo y número de documento"
+        )
 
     # 2. VECTOR SEARCH CON TIMEOUT
     similar_chunks = []
-    try:
-        similar_chunks = await asyncio.wait_for(
-            search_similar_chunks(
-                patient_id=getattr(patient_info, 'patient_id', None),
-                question=input_data.question,
-                k=15,
-                min_score=0.3
-            ),
-            timeout=VECTOR_SEARCH_TIMEOUT_SECONDS
-        )
-    except asyncio.TimeoutError:
-        logger.warning(f"Vector search timeout después de {VECTOR_SEARCH_TIMEOUT_SECONDS}s")
-    except Exception as e:
-        logger.warning(f"Vector search falló: {type(e).__name__}")
+    question_embedding = await embed_task
+    if question_embedding is not None:
+        try:
+            similar_chunks = await asyncio.wait_for(
+                query_vector_index(
+                    patient_id=patient_info.patient_id,
+                    embedding_str=question_embedding,
+                    k=15,
+                    min_score=0.3
+                ),
+                timeout=VECTOR_SEARCH_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Vector search timeout después de {VECTOR_SEARCH_TIMEOUT_SECONDS}s")
+        except Exception as e:
+            logger.warning(f"Vector search falló: {type(e).__name__}")
 
     # 3. CONSTRUIR CONTEXTO
     try:
@@ -582,30 +640,29 @@ async def _process_query(
         )
     except Exception as e:
         logger.error(f"Error construyendo contexto: {type(e).__name__}")
-        return {
-            "status": "error",
-            "session_id": input_data.session_id,
-            "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "error": {
-                "code": "CONTEXT_BUILD_ERROR",
-                "message": "Error al construir contexto clínico",
-                "details": str(e)
-            }
-        }
+        return _err(
+            input_data.session_id, sequence_chat_id, timestamp,
+            "CONTEXT_BUILD_ERROR",
+            "Error al construir contexto clínico",
+            str(e)
+        )
 
-    # Extraer info del paciente
-    patient_id = getattr(patient_info, 'patient_id', None)
-    first_name = getattr(patient_info, 'first_name', 'Nombre')
-    first_surname = getattr(patient_info, 'first_surname', 'Apellido')
-    second_surname = getattr(patient_info, 'second_surname', '')
-    document_number = getattr(patient_info, 'document_number', 'No disponible')
-    doc_type = get_document_type_name(input_data.document_type_id)
+    # Extraer info del paciente una sola vez; el bloque "patient_info" es el
+    # mismo en todas las respuestas (sin datos, fallback y éxito)
+    (patient_id, first_name, first_surname,
+     second_surname, document_number) = _PATIENT_RESPONSE_FIELDS(patient_info)
     
     full_name = f"{first_name} {first_surname}"
     if second_surname:
         full_name += f" {second_surname}"
 
+    patient_block = {
+        "patient_id": patient_id,
+        "full_name": full_name,
+        "document_type": get_document_type_name(input_data.document_type_id),
+        "document_number": document_number
+    }
+
     # 4. VERIFICAR SI HAY DATOS (Caso: sin datos)
     total_records = (
         len(clinical_data.records.appointments) +
@@ -620,13 +677,8 @@ async def _process_query(
             "status": "success",
             "session_id": input_data.session_id,
             "sequence_chat_id": sequence_chat_id,
-            "timestamp": get_iso_timestamp(),
-            "patient_info": {
-                "patient_id": patient_id,
-                "full_name": full_name,
-                "document_type": doc_type,
-                "document_number": document_number
-            },
+            "timestamp": timestamp,
+            "patient_info": patient_block,
             "answer": {
                 "text": f"El paciente {full_name} no tiene citas médicas registradas en el sistema.",
                 "confidence": 1.0,
@@ -685,13 +737,8 @@ async def _process_query(
                     "status": "success",
                     "session_id": input_data.session_id,
                     "sequence_chat_id": sequence_chat_id,
-                    "timestamp": get_iso_timestamp(),
-                    "patient_info": {
-                        "patient_id": patient_id,
-                        "full_name": full_name,
-                        "document_type": doc_type,
-                        "document_number": document_number
-                    },
+                    "timestamp": timestamp,
+                    "patient_info": patient_block,
                     "answer": {
                         "text": fallback_text,
                         "confidence": 0.65,
@@ -719,13 +766,8 @@ async def _process_query(
                     "status": "success",
                     "session_id": input_data.session_id,
                     "sequence_chat_id": sequence_chat_id,
-                    "timestamp": get_iso_timestamp(),
-                    "patient_info": {
-                        "patient_id": patient_id,
-                        "full_name": full_name,
-                        "document_type": doc_type,
-                        "document_number": document_number
-                    },
+                    "timestamp": timestamp,
+                    "patient_info": patient_block,
                     "answer": {
                         "text": fallback_text,
                         "confidence": 0.65,
@@ -759,13 +801,8 @@ async def _process_query(
         "status": "success",
         "session_id": input_data.session_id,
         "sequence_chat_id": sequence_chat_id,
-        "timestamp": get_iso_timestamp(),
-        "patient_info": {
-            "patient_id": patient_id,
-            "full_name": full_name,
-            "document_type": doc_type,
-            "document_number": document_number
-        },
+        "timestamp": timestamp,
+        "patient_info": patient_block,
         "answer": {
             "text": llm_response.text,
             "confidence": getattr(llm_response, 'confidence', 0.94),
@@ -781,27 +818,67 @@ async def _process_query(
     }
 
     logger.info(f"Query completada exitosamente en {response['metadata']['query_time_ms']}ms")
+    set_cached_answer(cache_key, response)
+    
+    # 8. GUARDAR EN AUDIT LOGS (Historial, en segundo plano y por lotes)
+    await _save_audit_log(input_data, sequence_chat_id, sanitized_doc_number, response)
     
-    # 8. GUARDAR EN AUDIT LOGS (Historial)
+    return response
+
+
+def _fetch_patient(
+    document_type_id: int,
+    document_number: str
+) -> Tuple[Optional[PatientInfo], ClinicalDataResult]:
+    """
+    Paciente + registros clínicos con su propia sesión (corre en un hilo,
+    fuera del event loop). La sesión no se comparte con otras corrutinas.
+    """
+    db = SessionLocal()
     try:
-        from app.models.audit_logs import AuditLog
-        from uuid import UUID
-        
-        audit_log = AuditLog(
-            user_id=int(input_data.user_id),
-            session_id=UUID(input_data.session_id),
-            sequence_chat_id=sequence_chat_id,
-            document_type_id=input_data.document_type_id,
-            document_number=sanitized_doc_number,
-            question=input_data.question,
-            response_json=response
+        return fetch_patient_and_records(
+            db=db,
+            document_type_id=document_type_id,
+            document_number=document_number
         )
-        db.add(audit_log)
-        db.commit()
-        logger.info(f"Consulta guardada en audit_logs: audit_log_id={audit_log.audit_log_id}")
+    finally:
+        db.close()
+
+
+async def _embed_question_or_none(question: str) -> Optional[str]:
+    """
+    Embedding de la pregunta con timeout. Si falla, la consulta sigue sin
+    búsqueda semántica (igual que cuando falla el vector search).
+    """
+    try:
+        return await asyncio.wait_for(
+            embed_question(question),
+            timeout=VECTOR_SEARCH_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Embedding timeout después de {VECTOR_SEARCH_TIMEOUT_SECONDS}s")
+    except Exception as e:
+        logger.warning(f"Embedding de la pregunta falló: {type(e).__name__}")
+    return None
+
+
+async def _save_audit_log(
+    input_data: QueryInput,
+    sequence_chat_id: int,
+    sanitized_doc_number: str,
+    response: dict
+) -> None:
+    """Encola la consulta en audit_logs (historial) sin bloquear la respuesta"""
+    try:
+        await audit_writer.enqueue({
+            "user_id": int(input_data.user_id),
+            "session_id": UUID(input_data.session_id),
+            "sequence_chat_id": sequence_chat_id,
+            "document_type_id": input_data.document_type_id,
+            "document_number": sanitized_doc_number,
+            "question": input_data.question,
+            "response_json": response
+        })
     except Exception as e:
-        logger.error(f"Error guardando en audit_logs: {type(e).__name__}: {e}")
         # No fallar la petición si falla el guardado del log
-        db.rollback()
-    
-    return response
\ No newline at end of file
+        logger.error(f"Error encolando audit_log: {type(e).__name__}: {e}")
\ No newline at end of file
@@ -1,10 +1,10 @@
 # src/app/routers/user.py
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.schemas.user import UserResponse, UserUpdate
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.services.user import UserService  # ← Import directo
 from app.core.security import get_current_user
 from app.models.user import User
@@ -20,10 +20,10 @@ router = APIRouter(
     response_model=List[UserResponse],
     summary="Listar todos los usuarios"
 )
-def list_users(
+async def list_users(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -35,7 +35,7 @@ def list_users(
     if limit > 100:
         limit = 100
     
-    users = UserService.get_all_users(db, skip=skip, limit=limit)
+    users = await UserService.get_all_users(db, skip=skip, limit=limit)
     return users
 
 
@@ -44,7 +44,7 @@ def list_users(
     response_model=UserResponse,
     summary="Obtener perfil del usuario actual"
 )
-def get_current_user_profile(current_user: User = Depends(get_current_user)):
+async def get_current_user_profile(current_user: User = Depends(get_current_user)):
     """
     Obtiene el perfil del usuario autenticado actualmente.
     Requiere token JWT válido en el header Authorization.
@@ -57,16 +57,16 @@ def get_current_user_profile(current_user: User = Depends(get_current_user)):
     response_model=UserResponse,
     summary="Obtener usuario por ID"
 )
-def get_user(
+async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Obtiene la información de un usuario específico por su ID.
     Requiere autenticación.
     """
-    user = UserService.get_user_by_id(db, user_id)
+    user = await UserService.get_user_by_id(db, user_id)
     
     if not user:
         raise HTTPException(
@@ -82,10 +82,10 @@ def get_user(
     response_model=UserResponse,
     summary="Actualizar usuario"
 )
-def update_user(
+async def update_user(
     user_id: int,
     update_data: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -103,7 +103,7 @@ def update_user(
         # Convertir el schema a dict, excluyendo valores None
         update_dict = update_data.model_dump(exclude_unset=True)
         
-        updated_user = UserService.update_user(db, user_id, update_dict)
+        updated_user = await UserService.update_user(db, user_id, update_dict)
         
         if not updated_user:
             raise HTTPException(
@@ -125,10 +125,10 @@ def update_user(
     response_model=UserResponse,
     summary="Actualizar parcialmente un usuario"
 )
-def partial_update_user(
+async def partial_update_user(
     user_id: int,
     update_data: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -143,7 +143,7 @@ def partial_update_user(
     
     try:
         update_dict = update_data.model_dump(exclude_unset=True)
-        updated_user = UserService.update_user(db, user_id, update_dict)
+        updated_user = await UserService.update_user(db, user_id, update_dict)
         
         if not updated_user:
             raise HTTPException(
@@ -165,9 +165,9 @@ def partial_update_user(
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Desactivar usuario"
 )
-def deactivate_user(
+async def deactivate_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -182,7 +182,7 @@ def deactivate_user(
         )
     
     try:
-        success = UserService.deactivate_user(db, user_id)
+        success = await UserService.deactivate_user(db, user_id)
         
         if not success:
             raise HTTPException(
@@ -1,76 +1,102 @@
 # src/app/routers/websocket_chat.py
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, status
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
-import json
 import logging
 import asyncio
-from datetime import datetime, timezone
+import time
+from collections import deque
+from cachetools import TTLCache
+import orjson
 
-from app.services.auth_utils import verify_token
-from app.services.clinical_service import fetch_patient_and_records
+from app.services.auth_utils import verify_token, verify_cached_token
+from app.services.clinical_service import fetch_patient_and_records_async
 from app.services.vector_search import search_similar_chunks
-from app.services.llm_service import llm_service
-from app.database.database import SessionLocal
+from app.services.llm_service import llm_service, LLMResponse
+from app.services.rag_cache import qa_cache_key, get_cached_qa, set_cached_qa
+from app.routers.query import build_context_from_real_data, build_sources_from_real_data
+from app.database.database import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # Configuración de timeouts
-STREAMING_CHUNK_DELAY = 0.05
 MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # 10MB
 WEBSOCKET_TIMEOUT = 300  # 5 minutos
 
+# Streaming: los fragmentos del LLM se agrupan en un frame cada
+# TOKEN_BATCH_SIZE fragmentos o TOKEN_BATCH_INTERVAL segundos
+TOKEN_BATCH_SIZE = 8
+TOKEN_BATCH_INTERVAL = 0.02
+
+# Rate limiting: ventana deslizante de 60s por usuario
+RATE_LIMIT_WINDOW_SECONDS = 60
+
 
 class ConnectionManager:
     """Gestor de conexiones WebSocket con control de rate limiting"""
     
     def __init__(self):
         self.active_connections: dict[int, WebSocket] = {}
-        self.message_counts: dict[int, list] = {}
+        # Timestamps (time.monotonic) de mensajes por usuario, en un deque
+        # ordenado: los vencidos salen por la izquierda. La ventana es del usuario, no de
+        # la conexión: reconectar no la reinicia. Cada escritura renueva el
+        # TTL de la entrada (como EXPIRE); la de un usuario inactivo caduca
+        # sola, así que la memoria queda acotada sin limpiar al desconectar
+        self.message_counts: TTLCache = TTLCache(
+            maxsize=10_000, ttl=RATE_LIMIT_WINDOW_SECONDS
+        )
         self.max_messages_per_minute = 20
     
     async def connect(self, websocket: WebSocket, user_id: int):
         """Conecta un WebSocket y lo asocia a un usuario"""
         await websocket.accept()
         self.active_connections[user_id] = websocket
-        self.message_counts[user_id] = []
         logger.info(f"Usuario {user_id} conectado via WebSocket")
     
     def disconnect(self, user_id: int):
         """Desconecta un usuario"""
         if user_id in self.active_connections:
             del self.active_connections[user_id]
-        if user_id in self.message_counts:
-            del self.message_counts[user_id]
         logger.info(f"Usuario {user_id} desconectado")
     
     def check_rate_limit(self, user_id: int) -> bool:
-        """Verifica si el usuario ha excedido el rate limit"""
-        now = datetime.now()
-        one_minute_ago = now.timestamp() - 60
+        """
+        Verifica si el usuario ha excedido el rate limit.
+        Sin awaits: en el event loop la lectura y la escritura son atómicas.
+        """
+        now = time.monotonic()
+        window_start = now - RATE_LIMIT_WINDOW_SECONDS
+        
+        timestamps = self.message_counts.get(user_id)
+        if timestamps is None:
+            timestamps = deque()
         
         # Limpiar mensajes antiguos
-        if user_id in self.message_counts:
-            self.message_counts[user_id] = [
-                ts for ts in self.message_counts[user_id] 
-                if ts > one_minute_ago
-            ]
-            
-            # Verificar límite
-            if len(self.message_counts[user_id]) >= self.max_messages_per_minute:
-                return False
-            
-            # Agregar nuevo mensaje
-            self.message_counts[user_id].append(now.timestamp())
+        while timestamps and timestamps[0] <= window_start:
+            timestamps.popleft()
+        
+        # Reasignar renueva el TTL de la entrada
+        self.message_counts[user_id] = timestamps
+        
+        # Verificar límite
+        if len(timestamps) >= self.max_messages_per_minute:
+            return False
         
+        # Agregar nuevo mensaje
+        timestamps.append(now)
         return True
     
     async def send_json(self, websocket: WebSocket, data: dict):
-        """Envía datos JSON de forma segura"""
+        """
+        Envía datos JSON de forma segura.
+        Serializa con orjson (en C) en lugar del json de la stdlib que usa
+        WebSocket.send_json; sigue siendo un frame de texto para el cliente.
+        """
         try:
-            await websocket.send_json(data)
+            await websocket.send_text(orjson.dumps(data).decode())
         except Exception as e:
             logger.error(f"Error enviando JSON: {str(e)}")
             raise
@@ -79,9 +105,31 @@ class ConnectionManager:
 manager = ConnectionManager()
 
 
+# Último segundo formateado: los frames de un mismo segundo (status,
+# stream, complete) reutilizan el string. Solo se usa desde el event loop
+_last_timestamp_second = -1
+_last_timestamp = ""
+
+
 def get_iso_timestamp() -> str:
     """Retorna timestamp en formato ISO 8601"""
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    global _last_timestamp_second, _last_timestamp
+    second = int(time.time())
+    if second != _last_timestamp_second:
+        t = time.gmtime(second)
+        _last_timestamp = (
+            f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}"
+            f"T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}Z"
+        )
+        _last_timestamp_second = second
+    return _last_timestamp
+
+
+# Caracteres de control C0, DEL y C1 (salvo \n y \r) a eliminar con
+# str.translate, en C. Son los no imprimibles habituales en texto de chat
+_CONTROL_CHARS_TABLE = dict.fromkeys(
+    c for c in (*range(0x20), *range(0x7F, 0xA0)) if c not in (0x0A, 0x0D)
+)
 
 
 def sanitize_input(text: str, max_length: int = 1000) -> str:
@@ -96,7 +144,11 @@ def sanitize_input(text: str, max_length: int = 1000) -> str:
         Texto sanitizado
     """
     # Eliminar caracteres de control excepto saltos de línea
-    sanitized = ''.join(char for char in text if char.isprintable() or char in '\n\r')
+    sanitized = text.translate(_CONTROL_CHARS_TABLE)
+    # Quedan no imprimibles fuera de C0/C1 (separadores Unicode, formato,
+    # no asignados): solo entonces se recorre carácter a carácter
+    if not sanitized.replace('\n', '').replace('\r', '').isprintable():
+        sanitized = ''.join(char for char in sanitized if char.isprintable() or char in '\n\r')
     
     # Truncar si es muy largo
     if len(sanitized) > max_length:
@@ -154,8 +206,13 @@ async def websocket_endpoint(
     user_id = None
     
     try:
-        # SEGURIDAD: Validar token antes de aceptar conexión
-        token_data = verify_token(token)
+        # SEGURIDAD: Validar token antes de aceptar conexión.
+        # Token ya verificado (reconexión): lectura de caché en el loop.
+        # Si no, la verificación corre en el threadpool para no frenar
+        # otros handshakes
+        token_data = verify_cached_token(token)
+        if token_data is None:
+            token_data = await run_in_threadpool(verify_token, token)
         
         if not token_data:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token inválido")
@@ -197,8 +254,8 @@ async def websocket_endpoint(
                 
                 # Parsear JSON
                 try:
-                    data = json.loads(raw_data)
-                except json.JSONDecodeError:
+                    data = orjson.loads(raw_data)
+                except orjson.JSONDecodeError:
                     await manager.send_json(websocket, {
                         "type": "error",
                         "error": {
@@ -282,12 +339,21 @@ async def websocket_endpoint(
             manager.disconnect(user_id)
 
 
+async def _cached_tokens(text: str):
+    """Entrega una respuesta cacheada por el mismo camino que el streaming del LLM."""
+    yield text
+
+
 async def process_query(websocket: WebSocket, data: dict, user_id: int):
     """
     Procesa una query y envía la respuesta con streaming.
-    """
-    db = SessionLocal()
     
+    Si algo falla después de stream_start (el LLM a mitad de respuesta, o
+    una respuesta demasiado corta), se cierra el stream con stream_end
+    ("aborted": true) antes del error: el cliente nunca queda a mitad de
+    stream y descarta el texto parcial.
+    """
+    stream_started = False
     try:
         # Sanitizar inputs
         question = sanitize_input(data["question"], max_length=1000)
@@ -300,12 +366,15 @@ async def process_query(websocket: WebSocket, data: dict, user_id: int):
             "message": "Buscando información del paciente"
         })
         
-        # Buscar paciente
-        patient_info, clinical_data = fetch_patient_and_records(
-            db=db,
-            document_type_id=data["document_type_id"],
-            document_number=document_number
-        )
+        # Buscar paciente (async: el loop atiende otras conexiones mientras
+        # espera a la BD). La sesión solo vive durante la búsqueda, no
+        # durante la búsqueda vectorial ni el LLM
+        async with AsyncSessionLocal() as db:
+            patient_info, clinical_data = await fetch_patient_and_records_async(
+                db=db,
+                document_type_id=data["document_type_id"],
+                document_number=document_number
+            )
         
         if not patient_info:
             await manager.send_json(websocket, {
@@ -317,27 +386,40 @@ async def process_query(websocket: WebSocket, data: dict, user_id: int):
             })
             return
         
-        # Status: Búsqueda vectorial
-        await manager.send_json(websocket, {
-            "type": "status",
-            "message": "Analizando registros médicos"
-        })
-        
-        # Búsqueda vectorial
-        similar_chunks = await search_similar_chunks(
-            patient_id=patient_info.patient_id,
-            question=question,
-            k=15,
-            min_score=0.3
-        )
+        # Misma pregunta sobre el mismo paciente hace poco: se reutilizan
+        # los chunks y la respuesta (sin vector search ni LLM)
+        qa_key = qa_cache_key(patient_info.patient_id, question)
+        cached_qa = get_cached_qa(qa_key)
         
-        # Construir contexto
-        from app.routers.query import build_context_from_real_data
-        context = build_context_from_real_data(
-            patient_info=patient_info,
-            clinical_records=clinical_data.records,
-            similar_chunks=similar_chunks
-        )
+        if cached_qa is not None:
+            cached_chunks, cached_answer = cached_qa
+            similar_chunks = list(cached_chunks)
+            token_stream = _cached_tokens(cached_answer)
+        else:
+            # Status: Búsqueda vectorial
+            await manager.send_json(websocket, {
+                "type": "status",
+                "message": "Analizando registros médicos"
+            })
+            
+            # Búsqueda vectorial
+            similar_chunks = await search_similar_chunks(
+                patient_id=patient_info.patient_id,
+                question=question,
+                k=15,
+                min_score=0.3
+            )
+            
+            # Construir contexto
+            context = build_context_from_real_data(
+                patient_info=patient_info,
+                clinical_records=clinical_data.records,
+                similar_chunks=similar_chunks
+            )
+            token_stream = llm_service.stream_llm(
+                question=question,
+                context=context
+            )
         
         # Status: Generando respuesta
         await manager.send_json(websocket, {
@@ -349,30 +431,46 @@ async def process_query(websocket: WebSocket, data: dict, user_id: int):
         await manager.send_json(websocket, {
             "type": "stream_start"
         })
+        stream_started = True
         
-        # Llamar al LLM
-        llm_response = await llm_service.run_llm(
-            question=question,
-            context=context
-        )
-        
-        # Enviar tokens uno por uno
-        if llm_response and llm_response.text:
-            words = llm_response.text.split()
-            for word in words:
+        # Llamar al LLM en streaming: los fragmentos se reenvían a medida
+        # que el modelo los genera, agrupados para no pagar un frame por
+        # fragmento. Mismo formato "token": el cliente solo concatena
+        answer_parts = []
+        pending = []
+        last_flush = time.monotonic()
+        async for token in token_stream:
+            answer_parts.append(token)
+            pending.append(token)
+            now = time.monotonic()
+            if len(pending) >= TOKEN_BATCH_SIZE or now - last_flush >= TOKEN_BATCH_INTERVAL:
                 await manager.send_json(websocket, {
                     "type": "token",
-                    "token": word + " "
+                    "token": "".join(pending)
                 })
-                await asyncio.sleep(STREAMING_CHUNK_DELAY)
+                pending.clear()
+                last_flush = now
+        
+        if pending:
+            await manager.send_json(websocket, {
+                "type": "token",
+                "token": "".join(pending)
+            })
+        
+        llm_response = LLMResponse(
+            text="".join(answer_parts).strip(),
+            model_used=llm_service.model
+        )
+        if cached_qa is None:
+            set_cached_qa(qa_key, similar_chunks, llm_response.text)
         
         # Fin de streaming
+        stream_started = False
         await manager.send_json(websocket, {
             "type": "stream_end"
         })
         
         # Construir sources
-        from app.routers.query import build_sources_from_real_data
         sources = build_sources_from_real_data(
             clinical_data.records,
             similar_chunks,
@@ -407,13 +505,15 @@ async def process_query(websocket: WebSocket, data: dict, user_id: int):
     
     except Exception as e:
         logger.error(f"Error procesando query: {str(e)}")
+        if stream_started:
+            await manager.send_json(websocket, {
+                "type": "stream_end",
+                "aborted": True
+            })
         await manager.send_json(websocket, {
             "type": "error",
             "error": {
                 "code": "PROCESSING_ERROR",
                 "message": "Error procesando la solicitud"
             }
-        })
-    
-    finally:
-        db.close()
\ No newline at end of file
+        })
\ No newline at end of file
@@ -0,0 +1,165 @@
+# src/app/services/audit_writer.py
+
+import asyncio
+import logging
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.database.database import SessionLocal
+from app.models.audit_logs import AuditLog
+from app.services.history_cache import invalidate_history
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin de cola (shutdown)
+_STOP = object()
+
+DOCUMENT_NUMBER_MAX_LENGTH = AuditLog.__table__.c.document_number.type.length
+
+
+def _validate_row(row: dict) -> None:
+    """
+    Rechaza antes de encolar las filas que la BD rechazaría por datos
+    (user_id no positivo, document_number más largo que la columna).
+    """
+    user_id = row.get("user_id")
+    if not isinstance(user_id, int) or user_id <= 0:
+        raise ValueError(f"user_id inválido para audit_log: {user_id!r}")
+    if len(row.get("document_number") or "") > DOCUMENT_NUMBER_MAX_LENGTH:
+        raise ValueError(
+            f"document_number excede {DOCUMENT_NUMBER_MAX_LENGTH} caracteres"
+        )
+
+
+class AuditWriter:
+    """
+    Escribe audit_logs en segundo plano y por lotes: las consultas encolan
+    la fila y responden sin esperar el commit. Un solo worker agrupa hasta
+    `batch_size` filas o `flush_interval` segundos en un único INSERT + commit.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.2):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Arranca el worker (llamar desde el evento startup)."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+            logger.info("AuditWriter iniciado")
+
+    async def stop(self) -> None:
+        """Vacía la cola pendiente y detiene el worker (evento shutdown)."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+        self._queue = None
+        logger.info("AuditWriter detenido")
+
+    async def enqueue(self, row: dict) -> None:
+        """
+        Encola una fila de audit_logs (mismas claves que las columnas).
+        Sin worker activo (scripts, tests) se escribe directamente.
+        
+        Raises:
+            ValueError: si la fila no es válida para la tabla
+        """
+        _validate_row(row)
+        if self._queue is None:
+            await asyncio.to_thread(self._write_batch, [row])
+            return
+        await self._queue.put(row)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            
+            # Juntar más filas hasta llenar el lote o agotar el intervalo
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # No se reintenta: el historial no debe tumbar el servicio
+                logger.error(f"Error guardando {len(batch)} audit_logs: {type(e).__name__}: {e}")
+
+    @staticmethod
+    def _write_batch(rows: List[dict]) -> None:
+        db = SessionLocal()
+        try:
+            try:
+                db.execute(insert(AuditLog), rows)
+                db.commit()
+                written = rows
+            except (IntegrityError, DataError) as e:
+                # Una fila inválida (p. ej. user_id sin usuario) no debe
+                # descartar las del resto del lote: se reintenta fila a fila
+                db.rollback()
+                if len(rows) == 1:
+                    raise
+                logger.warning(
+                    f"Lote de {len(rows)} audit_logs rechazado ({type(e).__name__}), "
+                    f"reintentando fila a fila"
+                )
+                written = AuditWriter._write_rows(db, rows)
+            
+            for user_id in {row["user_id"] for row in written}:
+                invalidate_history(user_id)
+            logger.info(f"{len(written)} consultas guardadas en audit_logs")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _write_rows(db, rows: List[dict]) -> List[dict]:
+        """
+        Inserta cada fila en su propio SAVEPOINT y hace un único commit.
+        Solo se descartan (y se registran) las filas con datos inválidos;
+        otros errores (conexión) se propagan como en el lote.
+        """
+        written = []
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(AuditLog), [row])
+            except (IntegrityError, DataError) as e:
+                logger.error(
+                    f"audit_log descartado (user_id={row['user_id']}, "
+                    f"session_id={row['session_id']}, "
+                    f"sequence_chat_id={row['sequence_chat_id']}): {type(e).__name__}"
+                )
+                continue
+            written.append(row)
+        db.commit()
+        return written
+
+
+# Instancia global
+audit_writer = AuditWriter()
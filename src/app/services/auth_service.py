@@ -1,11 +1,12 @@
 # src/app/services/auth_service.py
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Dict
 
 from app.models.user import User
-from app.core.security import hash_password, verify_password, create_access_token
+from app.core.security import hash_password_async, verify_password_async, create_access_token
 
 
 class AuthService:
@@ -15,9 +16,10 @@ class AuthService:
     """
 
     @staticmethod
-    def register_user(db: Session, user_data) -> User:
+    async def register_user(db: AsyncSession, user_data) -> User:
         """
         Registra un nuevo usuario en el sistema.
+        bcrypt corre en su propio pool para no bloquear el event loop.
         
         Args:
             db: Sesión de base de datos
@@ -35,12 +37,12 @@ class AuthService:
             raise ValueError("La contraseña debe tener al menos 6 caracteres")
         
         # Verificar si el email ya existe
-        existing_user = db.query(User).filter(User.email == user_data.email).first()
+        existing_user = await AuthService.get_user_by_email(db, user_data.email)
         if existing_user:
             raise ValueError("El correo electrónico ya está registrado")
         
         # Hashear contraseña
-        hashed_password = hash_password(user_data.password)
+        hashed_password = await hash_password_async(user_data.password)
         
         # Crear nuevo usuario
         new_user = User(
@@ -54,18 +56,18 @@ class AuthService:
         
         try:
             db.add(new_user)
-            db.commit()
-            db.refresh(new_user)
+            await db.commit()
+            await db.refresh(new_user)
             return new_user
         except IntegrityError:
-            db.rollback()
+            await db.rollback()
             raise ValueError("Error de integridad: el correo ya existe")
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise Exception(f"Error al crear usuario: {str(e)}")
 
     @staticmethod
-    def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
         """
         Autentica un usuario validando email y contraseña.
         
@@ -78,19 +80,19 @@ class AuthService:
             User si las credenciales son correctas, None si no
         """
         # Buscar usuario por email
-        user = db.query(User).filter(User.email == email).first()
+        user = await AuthService.get_user_by_email(db, email)
         
         if not user:
             return None
         
         # Verificar contraseña
-        if not verify_password(password, user.password_hash):
+        if not await verify_password_async(password, user.password_hash):
             return None
         
         return user
 
     @staticmethod
-    def login(db: Session, email: str, password: str) -> Dict[str, str]:
+    async def login(db: AsyncSession, email: str, password: str) -> Dict[str, str]:
         """
         Procesa el login y genera el token JWT.
         
@@ -106,7 +108,7 @@ class AuthService:
             ValueError: Si las credenciales son incorrectas o el usuario está inactivo
         """
         # Autenticar usuario
-        user = AuthService.authenticate_user(db, email, password)
+        user = await AuthService.authenticate_user(db, email, password)
         
         if not user:
             raise ValueError("Credenciales incorrectas")
@@ -115,8 +117,8 @@ class AuthService:
         if not user.is_active:
             raise ValueError("Usuario inactivo. Contacte al administrador")
         
-        # Generar token JWT
-        token_data = {"sub": str(user.user_id)}
+        # Generar token JWT ("sub" es string por estándar; "uid" lleva el entero)
+        token_data = {"sub": str(user.user_id), "uid": user.user_id}
         access_token = create_access_token(token_data)
         
         return {
@@ -125,7 +127,7 @@ class AuthService:
         }
 
     @staticmethod
-    def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
         """
         Obtiene un usuario por su email.
         
@@ -136,10 +138,11 @@ class AuthService:
         Returns:
             User si existe, None si no
         """
-        return db.query(User).filter(User.email == email).first()
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
 
     @staticmethod
-    def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
+    async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
         """
         Obtiene un usuario por su ID.
         
@@ -150,4 +153,4 @@ class AuthService:
         Returns:
             User si existe, None si no
         """
-        return db.query(User).filter(User.user_id == user_id).first()
\ No newline at end of file
+        return await db.get(User, user_id)
\ No newline at end of file
@@ -4,32 +4,55 @@ Utilidades de autenticación para WebSocket y otros usos.
 """
 
 from typing import Optional, Dict
-from jose import jwt, JWTError
-from app.core.security import SECRET_KEY, ALGORITHM
+from app.core.security import decode_access_token, get_cached_token_payload
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _token_data(payload: dict) -> Optional[Dict]:
+    """Extrae user_id y exp del payload; None si no trae un usuario válido."""
+    user_id = payload.get("uid")
+    if not isinstance(user_id, int):
+        # Tokens emitidos antes de "uid": solo "sub" como string numérico
+        sub = payload.get("sub")
+        if not isinstance(sub, str) or not sub.isdigit():
+            logger.warning("Token sin 'uid' ni 'sub' válido")
+            return None
+        user_id = int(sub)
+    
+    return {
+        "user_id": user_id,
+        "exp": payload.get("exp")
+    }
+
+
+def verify_cached_token(token: str) -> Optional[Dict]:
+    """
+    Como verify_token pero solo con tokens ya verificados en caché: no hace
+    trabajo criptográfico y se puede llamar desde el event loop.
+    None si el token no está en caché (usar verify_token).
+    """
+    payload = get_cached_token_payload(token)
+    if payload is None:
+        return None
+    return _token_data(payload)
+
+
 def verify_token(token: str) -> Optional[Dict]:
     """
     Verifica y decodifica un token JWT.
+    Usa la caché de payloads verificados de decode_access_token: una
+    reconexión con el mismo token no repite la verificación de la firma.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            logger.warning("Token sin campo 'sub'")
+        payload = decode_access_token(token)
+        if payload is None:
+            logger.warning("Token JWT inválido o expirado")
             return None
         
-        return {
-            "user_id": int(user_id),
-            "exp": payload.get("exp")
-        }
+        return _token_data(payload)
         
-    except JWTError as e:
-        logger.warning(f"Token JWT inválido: {type(e).__name__}")
-        return None
     except ValueError as e:
         logger.warning(f"Error convirtiendo user_id: {e}")
         return None
@@ -1,7 +1,8 @@
 # src/app/services/clinical_service.py
 from typing import Optional, Tuple, List
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
 import logging
 
 # Modelos SQLAlchemy
@@ -25,35 +26,99 @@ from app.schemas.clinical import (
 
 logger = logging.getLogger(__name__)
 
-# ============================================================================ 
-# P2-2: Función para obtener paciente por documento
+# ============================================================================
+# Consultas y mapeos compartidos por las versiones síncrona (Session) y
+# asíncrona (AsyncSession): solo cambia cómo se ejecuta cada sentencia
 # ============================================================================
 
-def get_patient_by_document(
-    db: Session,
-    document_type_id: int,
-    document_number: str
-) -> Optional[PatientInfo]:
-    """
-    Busca paciente por document_type_id y document_number.
-    Devuelve PatientInfo si existe, o None si no se encuentra.
-    """
-    try:
-        patient = (
-            db.query(Patient)
-            .filter(
-                Patient.document_type_id == document_type_id,
-                Patient.document_number == document_number
-            )
-            .one_or_none()
-        )
-    except Exception:
-        logger.exception("Error ejecutando query get_patient_by_document")
-        raise
+# Query optimizada con DISTINCT ON para evitar duplicados
+# Toma la primera especialidad activa si el doctor tiene varias
+_SQL_APPOINTMENTS = text("""
+    SELECT DISTINCT ON (a.appointment_id)
+        a.appointment_id,
+        a.patient_id,
+        a.doctor_id,
+        a.room_id,
+        a.appointment_date,
+        a.start_time,
+        a.end_time,
+        a.appointment_type,
+        a.status,
+        a.reason,
+        a.creation_date,
+        d.first_name || ' ' || d.last_name AS doctor_name,
+        s.specialty_name,
+        d.medical_license_number
+    FROM smart_health.appointments a
+    INNER JOIN smart_health.doctors d ON a.doctor_id = d.doctor_id
+    LEFT JOIN smart_health.doctor_specialties ds ON d.doctor_id = ds.doctor_id AND ds.is_active = TRUE
+    LEFT JOIN smart_health.specialties s ON ds.specialty_id = s.specialty_id
+    WHERE a.patient_id = :patient_id
+    ORDER BY a.appointment_id, ds.certification_date DESC NULLS LAST
+""")
+
+_SQL_PRESCRIPTIONS = text("""
+    SELECT
+        p.prescription_id,
+        p.medical_record_id,
+        p.medication_id,
+        p.dosage,
+        p.frequency,
+        p.duration,
+        p.instruction,
+        p.prescription_date,
+        p.alert_generated,
+        COALESCE(m.commercial_name, 'Medicamento no especificado') AS medication_name,
+        m.active_ingredient,
+        m.presentation AS pharmaceutical_form
+    FROM smart_health.prescriptions p
+    INNER JOIN smart_health.medical_records mr
+        ON p.medical_record_id = mr.medical_record_id
+    LEFT JOIN smart_health.medications m
+        ON p.medication_id = m.medication_id
+    WHERE mr.patient_id = :patient_id
+    ORDER BY p.prescription_date DESC
+""")
+
+#  Query con SQL directo para obtener la fecha del medical_record
+_SQL_DIAGNOSES = text("""
+    SELECT
+        rd.record_diagnosis_id,
+        d.diagnosis_id,
+        d.icd_code,
+        d.description,
+        rd.diagnosis_type,
+        rd.note,
+        mr.registration_datetime AS diagnosis_date
+    FROM smart_health.diagnoses d
+    INNER JOIN smart_health.record_diagnoses rd
+        ON d.diagnosis_id = rd.diagnosis_id
+    INNER JOIN smart_health.medical_records mr
+        ON rd.medical_record_id = mr.medical_record_id
+    WHERE mr.patient_id = :patient_id
+    ORDER BY mr.registration_datetime DESC
+""")
 
-    if not patient:
-        return None
 
+# Paciente y registros médicos se leen como filas de la tabla, no como
+# entidades ORM: solo se copian a DTOs, así que no hace falta identity map
+# ni estado de instancia por fila
+def _patient_stmt(document_type_id: int, document_number: str):
+    return select(Patient.__table__).where(
+        Patient.document_type_id == document_type_id,
+        Patient.document_number == document_number
+    )
+
+
+def _medical_records_stmt(patient_id: int):
+    return (
+        select(MedicalRecord.__table__)
+        .where(MedicalRecord.patient_id == patient_id)
+        .order_by(MedicalRecord.registration_datetime.desc())
+    )
+
+
+def _to_patient_info(patient) -> PatientInfo:
     #  Mapear manualmente para manejar registration_date correctamente
     return PatientInfo(
         patient_id=patient.patient_id,
@@ -72,7 +137,142 @@ def get_patient_by_document(
     )
 
 
-# ============================================================================ 
+def _appointments_from_rows(rows) -> List[AppointmentDTO]:
+    # Convertir a DTOs
+    appointments = []
+    for row in rows:
+        apt_dict = {
+            'appointment_id': row.appointment_id,
+            'patient_id': row.patient_id,
+            'doctor_id': row.doctor_id,
+            'room_id': row.room_id,
+            'appointment_date': row.appointment_date,
+            'start_time': row.start_time,
+            'end_time': row.end_time,
+            'appointment_type': row.appointment_type,
+            'status': row.status,
+            'reason': row.reason,
+            'creation_date': row.creation_date,
+            # Campos del doctor
+            'doctor_name': row.doctor_name,
+            'specialty_name': row.specialty_name,
+            'medical_license_number': row.medical_license_number,
+        }
+        appointments.append(AppointmentDTO(**apt_dict))
+
+    # Ordenar por fecha después de eliminar duplicados
+    appointments.sort(key=lambda x: (x.appointment_date, x.start_time or x.creation_date), reverse=True)
+
+    return appointments
+
+
+def _prescriptions_from_rows(rows) -> List[PrescriptionDTO]:
+    prescriptions = []
+    for row in rows:
+        presc_dict = {
+            'prescription_id': row.prescription_id,
+            'medical_record_id': row.medical_record_id,
+            'medication_id': row.medication_id,
+            'dosage': row.dosage,
+            'frequency': row.frequency,
+            'duration': row.duration,
+            'instruction': row.instruction,
+            'prescription_date': row.prescription_date,
+            'alert_generated': row.alert_generated,
+            'medication_name': row.medication_name,
+            'active_ingredient': row.active_ingredient,
+            'pharmaceutical_form': row.pharmaceutical_form,
+        }
+        prescriptions.append(PrescriptionDTO(**presc_dict))
+
+    return prescriptions
+
+
+def _diagnoses_from_rows(rows) -> List[DiagnosisDTO]:
+    # Convertir a DTOs
+    diagnoses = []
+    for row in rows:
+        diag_dict = {
+            'record_diagnosis_id': row.record_diagnosis_id,
+            'diagnosis_id': row.diagnosis_id,
+            'icd_code': row.icd_code,
+            'description': row.description,
+            'diagnosis_type': row.diagnosis_type,
+            'note': row.note,
+            #  Fecha del diagnóstico (del medical_record)
+            'diagnosis_date': row.diagnosis_date,
+        }
+        diagnoses.append(DiagnosisDTO(**diag_dict))
+
+    return diagnoses
+
+
+def _clinical_data_result(
+    patient: Optional[PatientInfo],
+    appointments: List[AppointmentDTO],
+    medical_records: List[MedicalRecordDTO],
+    prescriptions: List[PrescriptionDTO],
+    diagnoses: List[DiagnosisDTO]
+) -> Tuple[Optional[PatientInfo], ClinicalDataResult]:
+    # Agrupar en ClinicalRecords
+    records = ClinicalRecords(
+        appointments=appointments,
+        medical_records=medical_records,
+        prescriptions=prescriptions,
+        diagnoses=diagnoses
+    )
+
+    # Determinar si hay datos (P2-5)
+    has_data = any([
+        len(appointments) > 0,
+        len(medical_records) > 0,
+        len(prescriptions) > 0,
+        len(diagnoses) > 0
+    ])
+
+    return patient, ClinicalDataResult(
+        patient=patient,
+        records=records,
+        has_data=has_data
+    )
+
+
+def _patient_not_found() -> Tuple[None, ClinicalDataResult]:
+    return None, ClinicalDataResult(
+        patient=None,
+        records=ClinicalRecords(),
+        has_data=False
+    )
+
+
+# ============================================================================
+# P2-2: Función para obtener paciente por documento
+# ============================================================================
+
+def get_patient_by_document(
+    db: Session,
+    document_type_id: int,
+    document_number: str
+) -> Optional[PatientInfo]:
+    """
+    Busca paciente por document_type_id y document_number.
+    Devuelve PatientInfo si existe, o None si no se encuentra.
+    """
+    try:
+        patient = db.execute(
+            _patient_stmt(document_type_id, document_number)
+        ).one_or_none()
+    except Exception:
+        logger.exception("Error ejecutando query get_patient_by_document")
+        raise
+
+    if not patient:
+        return None
+
+    return _to_patient_info(patient)
+
+
+# ============================================================================
 # P2-3: Funciones para obtener datos clínicos por paciente
 # ============================================================================
 
@@ -82,62 +282,9 @@ def get_appointments_by_patient(db: Session, patient_id: int) -> List[Appointmen
     ordenadas por fecha descendente.
     """
     try:
-        # Query optimizada con DISTINCT ON para evitar duplicados
-        # Toma la primera especialidad activa si el doctor tiene varias
-        query = text("""
-            SELECT DISTINCT ON (a.appointment_id)
-                a.appointment_id,
-                a.patient_id,
-                a.doctor_id,
-                a.room_id,
-                a.appointment_date,
-                a.start_time,
-                a.end_time,
-                a.appointment_type,
-                a.status,
-                a.reason,
-                a.creation_date,
-                d.first_name || ' ' || d.last_name AS doctor_name,
-                s.specialty_name,
-                d.medical_license_number
-            FROM smart_health.appointments a
-            INNER JOIN smart_health.doctors d ON a.doctor_id = d.doctor_id
-            LEFT JOIN smart_health.doctor_specialties ds ON d.doctor_id = ds.doctor_id AND ds.is_active = TRUE
-            LEFT JOIN smart_health.specialties s ON ds.specialty_id = s.specialty_id
-            WHERE a.patient_id = :patient_id
-            ORDER BY a.appointment_id, ds.certification_date DESC NULLS LAST
-        """)
-        
-        result = db.execute(query, {"patient_id": patient_id})
-        rows = result.fetchall()
-        
-        # Convertir a DTOs
-        appointments = []
-        for row in rows:
-            apt_dict = {
-                'appointment_id': row.appointment_id,
-                'patient_id': row.patient_id,
-                'doctor_id': row.doctor_id,
-                'room_id': row.room_id,
-                'appointment_date': row.appointment_date,
-                'start_time': row.start_time,
-                'end_time': row.end_time,
-                'appointment_type': row.appointment_type,
-                'status': row.status,
-                'reason': row.reason,
-                'creation_date': row.creation_date,
-                # Campos del doctor
-                'doctor_name': row.doctor_name,
-                'specialty_name': row.specialty_name,
-                'medical_license_number': row.medical_license_number,
-            }
-            appointments.append(AppointmentDTO(**apt_dict))
-        
-        # Ordenar por fecha después de eliminar duplicados
-        appointments.sort(key=lambda x: (x.appointment_date, x.start_time or x.creation_date), reverse=True)
-        
-        return appointments
-        
+        result = db.execute(_SQL_APPOINTMENTS, {"patient_id": patient_id})
+        return _appointments_from_rows(result.fetchall())
+
     except Exception:
         logger.exception("Error ejecutando query get_appointments_by_patient")
         raise
@@ -148,12 +295,7 @@ def get_medical_records_by_patient(db: Session, patient_id: int) -> List[Medical
     Obtiene todos los registros médicos de un paciente, ordenados por fecha descendente.
     """
     try:
-        records = (
-            db.query(MedicalRecord)
-            .filter(MedicalRecord.patient_id == patient_id)
-            .order_by(MedicalRecord.registration_datetime.desc())
-            .all()
-        )
+        records = db.execute(_medical_records_stmt(patient_id)).fetchall()
     except Exception:
         logger.exception("Error ejecutando query get_medical_records_by_patient")
         raise
@@ -166,52 +308,9 @@ def get_prescriptions_by_patient(db: Session, patient_id: int) -> List[Prescript
     Obtiene todas las prescripciones de un paciente con el nombre del medicamento.
     """
     try:
-        query = text("""
-            SELECT 
-                p.prescription_id,
-                p.medical_record_id,
-                p.medication_id,
-                p.dosage,
-                p.frequency,
-                p.duration,
-                p.instruction,
-                p.prescription_date,
-                p.alert_generated,
-                COALESCE(m.commercial_name, 'Medicamento no especificado') AS medication_name,
-                m.active_ingredient,
-                m.presentation AS pharmaceutical_form
-            FROM smart_health.prescriptions p
-            INNER JOIN smart_health.medical_records mr 
-                ON p.medical_record_id = mr.medical_record_id
-            LEFT JOIN smart_health.medications m 
-                ON p.medication_id = m.medication_id
-            WHERE mr.patient_id = :patient_id
-            ORDER BY p.prescription_date DESC
-        """)
-        
-        result = db.execute(query, {"patient_id": patient_id})
-        rows = result.fetchall()
-        
-        prescriptions = []
-        for row in rows:
-            presc_dict = {
-                'prescription_id': row.prescription_id,
-                'medical_record_id': row.medical_record_id,
-                'medication_id': row.medication_id,
-                'dosage': row.dosage,
-                'frequency': row.frequency,
-                'duration': row.duration,
-                'instruction': row.instruction,
-                'prescription_date': row.prescription_date,
-                'alert_generated': row.alert_generated,
-                'medication_name': row.medication_name,
-                'active_ingredient': row.active_ingredient,
-                'pharmaceutical_form': row.pharmaceutical_form,
-            }
-            prescriptions.append(PrescriptionDTO(**presc_dict))
-        
-        return prescriptions
-        
+        result = db.execute(_SQL_PRESCRIPTIONS, {"patient_id": patient_id})
+        return _prescriptions_from_rows(result.fetchall())
+
     except Exception:
         logger.exception("Error ejecutando query get_prescriptions_by_patient")
         raise
@@ -222,51 +321,15 @@ def get_diagnoses_by_patient(db: Session, patient_id: int) -> List[DiagnosisDTO]
     Obtiene todos los diagnósticos de un paciente con la fecha del registro médico.
     """
     try:
-        #  Query con SQL directo para obtener la fecha del medical_record
-        query = text("""
-            SELECT 
-                rd.record_diagnosis_id,
-                d.diagnosis_id,
-                d.icd_code,
-                d.description,
-                rd.diagnosis_type,
-                rd.note,
-                mr.registration_datetime AS diagnosis_date
-            FROM smart_health.diagnoses d
-            INNER JOIN smart_health.record_diagnoses rd 
-                ON d.diagnosis_id = rd.diagnosis_id
-            INNER JOIN smart_health.medical_records mr 
-                ON rd.medical_record_id = mr.medical_record_id
-            WHERE mr.patient_id = :patient_id
-            ORDER BY mr.registration_datetime DESC
-        """)
-        
-        result = db.execute(query, {"patient_id": patient_id})
-        rows = result.fetchall()
-        
-        # Convertir a DTOs
-        diagnoses = []
-        for row in rows:
-            diag_dict = {
-                'record_diagnosis_id': row.record_diagnosis_id,
-                'diagnosis_id': row.diagnosis_id,
-                'icd_code': row.icd_code,
-                'description': row.description,
-                'diagnosis_type': row.diagnosis_type,
-                'note': row.note,
-                #  Fecha del diagnóstico (del medical_record)
-                'diagnosis_date': row.diagnosis_date,
-            }
-            diagnoses.append(DiagnosisDTO(**diag_dict))
-        
-        return diagnoses
-        
+        result = db.execute(_SQL_DIAGNOSES, {"patient_id": patient_id})
+        return _diagnoses_from_rows(result.fetchall())
+
     except Exception:
         logger.exception("Error ejecutando query get_diagnoses_by_patient")
         raise
 
 
-# ============================================================================ 
+# ============================================================================
 # Función principal que integra todo (usada por P1)
 # ============================================================================
 
@@ -288,37 +351,65 @@ def fetch_patient_and_records(
 
     if not patient:
         # Paciente no encontrado
-        return None, ClinicalDataResult(
-            patient=None,
-            records=ClinicalRecords(),
-            has_data=False
-        )
-
-    # 2. Obtener todos los registros clínicos
-    appointments = get_appointments_by_patient(db, patient.patient_id)
-    medical_records = get_medical_records_by_patient(db, patient.patient_id)
-    prescriptions = get_prescriptions_by_patient(db, patient.patient_id)
-    diagnoses = get_diagnoses_by_patient(db, patient.patient_id)
+        return _patient_not_found()
 
-    # 3. Agrupar en ClinicalRecords
-    records = ClinicalRecords(
-        appointments=appointments,
-        medical_records=medical_records,
-        prescriptions=prescriptions,
-        diagnoses=diagnoses
+    # 2. Obtener todos los registros clínicos y agrupar (P2-5)
+    return _clinical_data_result(
+        patient,
+        get_appointments_by_patient(db, patient.patient_id),
+        get_medical_records_by_patient(db, patient.patient_id),
+        get_prescriptions_by_patient(db, patient.patient_id),
+        get_diagnoses_by_patient(db, patient.patient_id)
     )
 
-    # 4. Determinar si hay datos (P2-5)
-    has_data = any([
-        len(appointments) > 0,
-        len(medical_records) > 0,
-        len(prescriptions) > 0,
-        len(diagnoses) > 0
-    ])
 
-    # 5. Retornar resultado completo
-    return patient, ClinicalDataResult(
-        patient=patient,
-        records=records,
-        has_data=has_data
-    )
\ No newline at end of file
+async def fetch_patient_and_records_async(
+    db: AsyncSession,
+    document_type_id: int,
+    document_number: str
+) -> Tuple[Optional[PatientInfo], ClinicalDataResult]:
+    """
+    Igual que fetch_patient_and_records, con AsyncSession (asyncpg): cede el
+    event loop mientras espera a la BD en lugar de bloquearlo.
+    Las consultas van en secuencia: una AsyncSession no admite consultas
+    concurrentes.
+    """
+    try:
+        # 1. Buscar paciente
+        patient = (await db.execute(
+            _patient_stmt(document_type_id, document_number)
+        )).one_or_none()
+
+        if not patient:
+            # Paciente no encontrado
+            return _patient_not_found()
+
+        patient_id = patient.patient_id
+        params = {"patient_id": patient_id}
+
+        # 2. Obtener todos los registros clínicos
+        appointments = _appointments_from_rows(
+            (await db.execute(_SQL_APPOINTMENTS, params)).fetchall()
+        )
+        medical_records = [
+            MedicalRecordDTO.from_orm(rec)
+            for rec in (await db.execute(_medical_records_stmt(patient_id))).fetchall()
+        ]
+        prescriptions = _prescriptions_from_rows(
+            (await db.execute(_SQL_PRESCRIPTIONS, params)).fetchall()
+        )
+        diagnoses = _diagnoses_from_rows(
+            (await db.execute(_SQL_DIAGNOSES, params)).fetchall()
+        )
+    except Exception:
+        logger.exception("Error ejecutando queries de fetch_patient_and_records_async")
+        raise
+
+    # 3. Agrupar y retornar resultado completo (P2-5)
+    return _clinical_data_result(
+        _to_patient_info(patient),
+        appointments,
+        medical_records,
+        prescriptions,
+        diagnoses
+    )
@@ -0,0 +1,64 @@
+# src/app/services/history_cache.py
+
+from itertools import count
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from cachetools import TTLCache
+
+
+# Respuestas de GET /history/ ya serializadas (ETag, bytes JSON): una entrada
+# por usuario con un dict limit -> (ETag, JSON). TTL corto y por proceso:
+# además se invalida al guardar nuevos audit_logs del usuario, así que en el
+# worker que escribe el historial nunca queda viejo. La caducidad y el
+# desalojo quitan todos los limits del usuario a la vez, sin índice aparte.
+_history_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+_history_cache_lock = Lock()
+
+# Generación por usuario: cada invalidación le asigna un valor nuevo. Quien
+# consulta la BD lee la generación antes y solo guarda el resultado si no
+# cambió: una invalidación entre la consulta y el guardado (auditoría
+# recién escrita) no deja en caché un historial viejo. Basta con que la
+# entrada viva más que una consulta (timeout de 5s)
+_generations: TTLCache = TTLCache(maxsize=100_000, ttl=60)
+_generation_counter = count(1)
+
+
+def history_generation(user_id: int) -> int:
+    """Generación actual del historial de un usuario (leer antes de consultar)."""
+    with _history_cache_lock:
+        return _generations.get(user_id, 0)
+
+
+def get_cached_history(user_id: int, limit: int) -> Optional[Tuple[str, bytes]]:
+    """Devuelve (ETag, JSON) cacheados del historial, o None si no está."""
+    with _history_cache_lock:
+        by_limit = _history_cache.get(user_id)
+        return by_limit.get(limit) if by_limit is not None else None
+
+
+def set_cached_history(user_id: int, limit: int, etag: str, body: bytes, generation: int) -> None:
+    """
+    Guarda el ETag y el JSON del historial de un usuario para un limit dado,
+    salvo que se haya invalidado desde que se leyó `generation`.
+    """
+    with _history_cache_lock:
+        if _generations.get(user_id, 0) != generation:
+            return
+        by_limit: Optional[Dict[int, Tuple[str, bytes]]] = _history_cache.get(user_id)
+        if by_limit is None:
+            _history_cache[user_id] = {limit: (etag, body)}
+        else:
+            # Sin reasignar: el TTL cuenta desde el primer limit guardado,
+            # así ninguna respuesta del usuario vive más de 30s
+            by_limit[limit] = (etag, body)
+
+
+def invalidate_history(user_id: int) -> None:
+    """
+    Elimina todas las entradas de un usuario. Llamar tras escribir
+    audit_logs suyos.
+    """
+    with _history_cache_lock:
+        _history_cache.pop(user_id, None)
+        _generations[user_id] = next(_generation_counter)
@@ -1,8 +1,11 @@
 # src/app/services/llm_service.py
 
 import os
+import hashlib
 import logging
-from typing import Optional
+from threading import Lock
+from typing import AsyncIterator, Optional
+from cachetools import TTLCache
 from openai import AsyncOpenAI
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -12,6 +15,56 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Prompt de sistema constante: se arma una sola vez al importar
+SYSTEM_PROMPT = (
+    "Eres un asistente médico amigable y profesional.\n"
+    "Respondes en un tono conversacional, como en un chat, sin usar símbolos de Markdown como ### o **.\n\n"
+    "INSTRUCCIONES:\n"
+    "1. Responde ÚNICAMENTE con la información del contexto clínico proporcionado.\n"
+    "2. Si no tienes información, di 'No tengo esa información en el historial'.\n"
+    "3. Usa un lenguaje claro y natural, como si hablaras con un colega.\n"
+    "4. Organiza la información de forma cronológica cuando sea relevante.\n"
+    "5. Menciona fechas, medicamentos y diagnósticos de forma natural en el texto.\n"
+    "6. NO uses:\n"
+    "   - Símbolos ### para títulos\n"
+    "   - Asteriscos ** para negritas\n"
+    "   - Guiones - para viñetas\n"
+    "7. En lugar de listas con viñetas, escribe párrafos fluidos.\n"
+    "8. Separa ideas con saltos de línea simples para mejor legibilidad.\n\n"
+    "EJEMPLO DE ESTILO:\n"
+    "Según el historial clínico, el paciente tuvo una cita el 2 de marzo de 2022 para control de presión arterial con la doctora Camila Cárdenas.\n\n"
+    "El 10 de octubre de 2022 acudió a emergencia por síntomas respiratorios.\n\n"
+    "La más reciente fue el 9 de noviembre de 2024, un examen médico de chequeo general con la doctora Carolina Gutiérrez, especialista en medicina física y rehabilitación.\n"
+)
+
+# Respuestas del LLM por hash de (contexto, pregunta, max_tokens). El contexto
+# ya incluye los datos del paciente, así que una misma pregunta sobre el mismo
+# historial (reintento, reformulación idéntica, /query o websocket) no vuelve a
+# llamar a la API. Si los datos del paciente cambian, cambia el contexto y la clave.
+LLM_CACHE_TTL_SECONDS = 300
+
+_llm_cache = TTLCache(maxsize=1024, ttl=LLM_CACHE_TTL_SECONDS)
+_llm_cache_lock = Lock()
+
+
+def _llm_cache_key(question: str, context: str, max_tokens: int) -> bytes:
+    """blake2b (más rápido que sha256) del contexto y la pregunta normalizada."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(context.encode("utf-8"))
+    h.update(b"\0")
+    h.update(" ".join(question.split()).casefold().encode("utf-8"))
+    h.update(b"\0%d" % max_tokens)
+    return h.digest()
+
+
+def _user_message(question: str, context: str) -> str:
+    return (
+        f"CONTEXTO CLÍNICO:\n{context}\n\n"
+        f"PREGUNTA DEL USUARIO:\n{question}\n\n"
+        "Responde únicamente con la información del contexto."
+    )
+
+
 class LLMResponse(BaseModel):
     """Respuesta estructurada del LLM."""
     text: str
@@ -47,32 +100,14 @@ class LLMService:
         if max_tokens is None:
             max_tokens = self.max_tokens
 
-        system_prompt = (
-            "Eres un asistente médico amigable y profesional.\n"
-            "Respondes en un tono conversacional, como en un chat, sin usar símbolos de Markdown como ### o **.\n\n"
-            "INSTRUCCIONES:\n"
-            "1. Responde ÚNICAMENTE con la información del contexto clínico proporcionado.\n"
-            "2. Si no tienes información, di 'No tengo esa información en el historial'.\n"
-            "3. Usa un lenguaje claro y natural, como si hablaras con un colega.\n"
-            "4. Organiza la información de forma cronológica cuando sea relevante.\n"
-            "5. Menciona fechas, medicamentos y diagnósticos de forma natural en el texto.\n"
-            "6. NO uses:\n"
-            "   - Símbolos ### para títulos\n"
-            "   - Asteriscos ** para negritas\n"
-            "   - Guiones - para viñetas\n"
-            "7. En lugar de listas con viñetas, escribe párrafos fluidos.\n"
-            "8. Separa ideas con saltos de línea simples para mejor legibilidad.\n\n"
-            "EJEMPLO DE ESTILO:\n"
-            "Según el historial clínico, el paciente tuvo una cita el 2 de marzo de 2022 para control de presión arterial con la doctora Camila Cárdenas.\n\n"
-            "El 10 de octubre de 2022 acudió a emergencia por síntomas respiratorios.\n\n"
-            "La más reciente fue el 9 de noviembre de 2024, un examen médico de chequeo general con la doctora Carolina Gutiérrez, especialista en medicina física y rehabilitación.\n"
-        )
-
-        user_message = (
-            f"CONTEXTO CLÍNICO:\n{context}\n\n"
-            f"PREGUNTA DEL USUARIO:\n{question}\n\n"
-            "Responde únicamente con la información del contexto."
-        )
+        cache_key = _llm_cache_key(question, context, max_tokens)
+        with _llm_cache_lock:
+            cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Respuesta del LLM servida desde caché.")
+            return cached
+
+        user_message = _user_message(question, context)
 
         try:
             logger.info("Llamando a la API de OpenAI.")
@@ -82,7 +117,7 @@ class LLMService:
                 model=self.model,
                 max_completion_tokens=max_tokens,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user_message}
                 ],
                 temperature=0.3,
@@ -102,17 +137,84 @@ class LLMService:
 
             logger.info(f"Respuesta del LLM recibida. Tokens usados: {tokens_used}")
 
-            return LLMResponse(
+            llm_response = LLMResponse(
                 text=response_text.strip(),
                 confidence=0.85,
                 model_used=self.model,
                 tokens_used=tokens_used
             )
+            with _llm_cache_lock:
+                _llm_cache[cache_key] = llm_response
+            return llm_response
 
         except Exception as e:
             logger.error(f"Error en la llamada al LLM: {type(e).__name__}: {str(e)}")
             raise
 
+    async def stream_llm(
+        self,
+        question: str,
+        context: str,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Igual que run_llm, pero entrega el texto a medida que el modelo lo
+        genera (stream=True). Una respuesta en caché se entrega en un solo
+        fragmento; una respuesta completa válida se guarda en la caché.
+        """
+        
+        if max_tokens is None:
+            max_tokens = self.max_tokens
+
+        cache_key = _llm_cache_key(question, context, max_tokens)
+        with _llm_cache_lock:
+            cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Respuesta del LLM servida desde caché.")
+            yield cached.text
+            return
+
+        try:
+            logger.info("Llamando a la API de OpenAI (streaming).")
+            logger.debug(f"Longitud del contexto: {len(context)} caracteres.")
+
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                max_completion_tokens=max_tokens,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": _user_message(question, context)}
+                ],
+                temperature=0.3,
+                stream=True,
+            )
+
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+            response_text = "".join(parts).strip()
+            if len(response_text) < 10:
+                raise ValueError("La respuesta generada no es válida.")
+
+            logger.info(f"Streaming del LLM completado. Caracteres: {len(response_text)}")
+
+            with _llm_cache_lock:
+                _llm_cache[cache_key] = LLMResponse(
+                    text=response_text,
+                    confidence=0.85,
+                    model_used=self.model
+                )
+
+        except Exception as e:
+            logger.error(f"Error en el streaming del LLM: {type(e).__name__}: {str(e)}")
+            raise
+
 
 # Singleton global
 llm_service = LLMService()
\ No newline at end of file
@@ -0,0 +1,71 @@
+# src/app/services/rag_cache.py
+
+import hashlib
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from cachetools import TTLCache
+
+
+# Respuestas completas de /query por (tipo de documento, documento, pregunta).
+# Una repetición (reintento, misma pregunta en otra sesión) evita la búsqueda
+# del paciente, el vector search y el LLM. Los datos clínicos los cargan los
+# pipelines, no la API: no hay evento de escritura con el que invalidar, así
+# que el TTL acota cuánto tarda en verse un dato nuevo.
+RAG_CACHE_TTL_SECONDS = 600
+
+_rag_cache = TTLCache(maxsize=1024, ttl=RAG_CACHE_TTL_SECONDS)
+_rag_cache_lock = Lock()
+
+
+# Chat WebSocket: (chunks del vector search, texto de la respuesta) por
+# (paciente, pregunta). Un reintento o la misma pregunta enseguida se
+# responde sin embedding, vector search ni LLM; los registros clínicos
+# se siguen leyendo frescos para las sources
+QA_CACHE_TTL_SECONDS = 120
+
+_qa_cache = TTLCache(maxsize=2000, ttl=QA_CACHE_TTL_SECONDS)
+_qa_cache_lock = Lock()
+
+
+def _question_digest(question: str) -> bytes:
+    """
+    La pregunta se normaliza (espacios y mayúsculas) y se resume con
+    blake2b para no guardar el texto completo como clave.
+    """
+    normalized = " ".join(question.split()).casefold()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+def rag_cache_key(document_type_id: int, document_number: str, question: str) -> Tuple[int, str, bytes]:
+    """Clave de caché de /query: documento del paciente y pregunta."""
+    return document_type_id, document_number, _question_digest(question)
+
+
+def get_cached_answer(key: Tuple[int, str, bytes]) -> Optional[dict]:
+    """Devuelve la respuesta cacheada, o None si no está."""
+    with _rag_cache_lock:
+        return _rag_cache.get(key)
+
+
+def set_cached_answer(key: Tuple[int, str, bytes], response: dict) -> None:
+    """Guarda una respuesta exitosa del LLM (no las de fallback)."""
+    with _rag_cache_lock:
+        _rag_cache[key] = response
+
+
+def qa_cache_key(patient_id: int, question: str) -> Tuple[int, bytes]:
+    """Clave de caché del chat WebSocket: paciente y pregunta."""
+    return patient_id, _question_digest(question)
+
+
+def get_cached_qa(key: Tuple[int, bytes]) -> Optional[Tuple[tuple, str]]:
+    """Devuelve (chunks, respuesta) cacheados, o None si no está."""
+    with _qa_cache_lock:
+        return _qa_cache.get(key)
+
+
+def set_cached_qa(key: Tuple[int, bytes], similar_chunks: List, answer_text: str) -> None:
+    """Guarda los chunks (como tupla, sin copias mutables) y la respuesta."""
+    with _qa_cache_lock:
+        _qa_cache[key] = (tuple(similar_chunks), answer_text)
@@ -1,7 +1,9 @@
 # app/services/user_service.py
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.user import User
+from .user_cache import invalidate_user
 from typing import Optional, List
 
 
@@ -11,7 +13,7 @@ class UserService:
     """
 
     @staticmethod
-    def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
+    async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
         """
         Obtiene un usuario por su ID.
         
@@ -22,10 +24,10 @@ class UserService:
         Returns:
             User si existe, None si no
         """
-        return db.query(User).filter(User.user_id == user_id).first()
+        return await db.get(User, user_id)
 
     @staticmethod
-    def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
         """
         Obtiene un usuario por su email.
         
@@ -36,10 +38,11 @@ class UserService:
         Returns:
             User si existe, None si no
         """
-        return db.query(User).filter(User.email == email).first()
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
 
     @staticmethod
-    def get_all_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
+    async def get_all_users(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[User]:
         """
         Obtiene todos los usuarios con paginación.
         
@@ -51,10 +54,11 @@ class UserService:
         Returns:
             Lista de usuarios
         """
-        return db.query(User).offset(skip).limit(limit).all()
+        result = await db.execute(select(User).offset(skip).limit(limit))
+        return list(result.scalars().all())
 
     @staticmethod
-    def update_user(db: Session, user_id: int, update_data: dict) -> Optional[User]:
+    async def update_user(db: AsyncSession, user_id: int, update_data: dict) -> Optional[User]:
         """
         Actualiza los datos de un usuario.
         
@@ -70,7 +74,7 @@ class UserService:
             ValueError: Si hay error en la validación
             Exception: Para otros errores
         """
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return None
@@ -81,15 +85,16 @@ class UserService:
                 setattr(user, field, value)
         
         try:
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            invalidate_user(user_id)
+            await db.refresh(user)
             return user
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise Exception(f"Error al actualizar usuario: {str(e)}")
 
     @staticmethod
-    def deactivate_user(db: Session, user_id: int) -> bool:
+    async def deactivate_user(db: AsyncSession, user_id: int) -> bool:
         """
         Desactiva un usuario (soft delete).
         
@@ -100,7 +105,7 @@ class UserService:
         Returns:
             True si se desactivó correctamente, False si no existe
         """
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return False
@@ -108,14 +113,15 @@ class UserService:
         user.is_active = False
         
         try:
-            db.commit()
+            await db.commit()
+            invalidate_user(user_id)
             return True
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise Exception(f"Error al desactivar usuario: {str(e)}")
 
     @staticmethod
-    def activate_user(db: Session, user_id: int) -> bool:
+    async def activate_user(db: AsyncSession, user_id: int) -> bool:
         """
         Activa un usuario previamente desactivado.
         
@@ -126,7 +132,7 @@ class UserService:
         Returns:
             True si se activó correctamente, False si no existe
         """
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return False
@@ -134,14 +140,15 @@ class UserService:
         user.is_active = True
         
         try:
-            db.commit()
+            await db.commit()
+            invalidate_user(user_id)
             return True
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise Exception(f"Error al activar usuario: {str(e)}")
 
     @staticmethod
-    def delete_user_permanently(db: Session, user_id: int) -> bool:
+    async def delete_user_permanently(db: AsyncSession, user_id: int) -> bool:
         """
         Elimina permanentemente un usuario de la base de datos.
         ADVERTENCIA: Esta operación no se puede deshacer.
@@ -153,15 +160,16 @@ class UserService:
         Returns:
             True si se eliminó, False si no existe
         """
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return False
         
         try:
-            db.delete(user)
-            db.commit()
+            await db.delete(user)
+            await db.commit()
+            invalidate_user(user_id)
             return True
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise Exception(f"Error al eliminar usuario: {str(e)}")
\ No newline at end of file
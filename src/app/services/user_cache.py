@@ -0,0 +1,58 @@
+# src/app/services/user_cache.py
+
+from threading import Lock
+from typing import Optional
+
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+
+
+# Cache-aside de usuarios autenticados, por user_id.
+# Se guardan instancias desacopladas de la sesión (solo lectura: columnas
+# cargadas, sin relaciones perezosas). Es por proceso: con varios workers
+# un cambio tarda como máximo el TTL en verse en los demás.
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
+_user_cache_lock = Lock()
+
+
+async def get_cached_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    """
+    Obtiene un usuario por su ID, consultando la base de datos solo si
+    no está en caché.
+    
+    Args:
+        db: Sesión de base de datos
+        user_id: ID del usuario
+        
+    Returns:
+        User (desacoplado de la sesión) si existe, None si no
+    """
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    
+    if user is not None:
+        return user
+    
+    user = await db.get(User, user_id)
+    
+    if user is None:
+        return None
+    
+    # Sacarlo de la sesión: un commit posterior no debe expirar sus atributos
+    db.expunge(user)
+    
+    with _user_cache_lock:
+        _user_cache[user_id] = user
+    
+    return user
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Elimina un usuario de la caché. Llamar tras cualquier cambio en su fila
+    (datos, is_active, borrado).
+    """
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
@@ -46,7 +46,10 @@ if __name__ == "__main__":
             host="127.0.0.1",
             port=8000,
             reload=True,
-            log_level="info"
+            log_level="info",
+            # uvloop + httptools si están instalados (uvloop no existe en Windows)
+            loop="auto",
+            http="auto"
         )
     except Exception as e:
         print(f"✗ Error al cargar la aplicación: {e}")